@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Benchmark the YAML backends of json_to_yaml.py, LibYAML (CSafeLoader and
+CSafeDumper) against pure Python (SafeLoader and SafeDumper), on generated
+fixtures and check that both give the same output.
+
+The "text" fixture has non-ASCII strings, which json_to_yaml.py dumps with
+the pure Python dumper as LibYAML folds them differently, likewise the
+"long_keys" fixture has keys LibYAML writes differently.
+
+Each fixture is dumped to YAML (json_to_yaml.py) and loaded back (--reverse)
+with each backend. Exits with 1 if the outputs differ.
+
+Usage: bench_json_to_yaml.py [--size N] [--repeat N] [fixture.json|.yaml ...]
+"""
+import argparse
+import io
+import json
+import os
+import pathlib
+import random
+import sys
+import time
+
+import yaml
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "scripts"))
+
+import json_to_yaml  # noqa: E402
+
+json_to_yaml.import_yaml()
+
+
+def python_dump(data):
+    return yaml.dump(data, Dumper=yaml.SafeDumper)
+
+
+def libyaml_dump(data):
+    out = io.StringIO()
+    json_to_yaml.dump_yaml(data, out)
+    return out.getvalue()
+
+
+BACKENDS = {
+    "python": (yaml.SafeLoader, python_dump),
+    "libyaml": (json_to_yaml.SafeLoader, libyaml_dump),
+}
+
+
+def manifests(size, rnd):
+    """Kubernetes deployments, like `kubectl get deployments -o json`."""
+    items = []
+    for i in range(size):
+        name = f"service-{i}"
+        items.append(
+            {
+                "apiVersion": "apps/v1",
+                "kind": "Deployment",
+                "metadata": {
+                    "name": name,
+                    "namespace": "default",
+                    "labels": {"app": name, "tier": rnd.choice(["web", "db"])},
+                    "annotations": {
+                        "deployment.kubernetes.io/revision": str(rnd.randint(1, 9))
+                    },
+                },
+                "spec": {
+                    "replicas": rnd.randint(1, 5),
+                    "selector": {"matchLabels": {"app": name}},
+                    "template": {
+                        "spec": {
+                            "containers": [
+                                {
+                                    "name": name,
+                                    "image": f"registry.example.com/{name}:1.{i}",
+                                    "args": ["--port", "8080", "--verbose"],
+                                    "env": [
+                                        {"name": "DEBUG", "value": "false"},
+                                        {"name": "RATIO", "value": "0.5"},
+                                    ],
+                                    "ports": [{"containerPort": 8080}],
+                                    "resources": {"limits": {"memory": "128Mi"}},
+                                }
+                            ]
+                        }
+                    },
+                },
+            }
+        )
+    return {"apiVersion": "v1", "kind": "List", "items": items}
+
+
+def records(size, rnd):
+    """API dump of flat records with all scalar types."""
+    return [
+        {
+            "id": i,
+            "uuid": "%032x" % rnd.getrandbits(128),
+            "score": rnd.random() * 1000,
+            "active": rnd.random() < 0.5,
+            "parent": None if i % 3 else i - 1,
+            "tags": rnd.sample(["a", "b", "yes", "no", "on", "null", "1.0"], 3),
+            "created": "2024-01-%02dT12:00:00Z" % (i % 28 + 1),
+        }
+        for i in range(size * 5)
+    ]
+
+
+def text(size, rnd):
+    """Long, multi-line, unicode and special character strings."""
+    words = ["lorem", "ipsum", "dolor", "sït", "ämet", "日本", "#", ": ", "- ", "'"]
+    return {
+        f"key {i}": {
+            "line": " ".join(rnd.choice(words) for _ in range(30)),
+            "lines": "\n".join(
+                " ".join(rnd.choice(words) for _ in range(8)) for _ in range(5)
+            ),
+            "quoted": '"%s" \\ \t end ' % rnd.choice(words),
+        }
+        for i in range(size)
+    }
+
+
+def long_keys(size, rnd):
+    """Keys of 100 to 200 characters, with and without spaces, next to short
+    keys, like flattened paths or sentences as keys."""
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "a/b/c", "x.y"]
+
+    def key(length):
+        sep = rnd.choice([" ", "/", "."])
+        return sep.join(rnd.choice(words) for _ in range(length))[:length]
+
+    return [
+        {
+            "id": i,
+            key(rnd.randint(100, 200)): i,
+            "nested": {key(rnd.randint(100, 200)): {"short": key(150)}},
+            "plain": {"short": key(20), "medium": key(90)},
+        }
+        for i in range(size)
+    ]
+
+
+FIXTURES = {
+    "manifests": manifests,
+    "records": records,
+    "text": text,
+    "long_keys": long_keys,
+}
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(name, data, repeat):
+    """Benchmark one fixture, return False if the backends disagree."""
+    results = {}
+    for backend, (loader, dump) in BACKENDS.items():
+        dump_time, dumped = best_time(lambda: dump(data), repeat)
+        load_time, loaded = best_time(lambda: yaml.load(dumped, Loader=loader), repeat)
+        results[backend] = (dumped, loaded)
+        print(
+            f"{name:<12}{backend:<10}{len(dumped) / 1e6:>8.2f}"
+            f"{dump_time:>10.3f}{load_time:>10.3f}"
+        )
+    (python_dumped, python_loaded), (libyaml_dumped, libyaml_loaded) = (
+        results["python"],
+        results["libyaml"],
+    )
+    if python_dumped != libyaml_dumped:
+        print(f"{name}: dumped YAML differs")
+        return False
+    if python_loaded != libyaml_loaded or python_loaded != data:
+        print(f"{name}: loaded data differs")
+        return False
+    return True
+
+
+def load_fixture(path):
+    with open(path) as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        return yaml.load(f, Loader=yaml.SafeLoader)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--size", type=int, default=500, help="Generated fixture size")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("fixtures", nargs="*", help="Use these fixtures instead")
+    args = parser.parse_args()
+    print(json_to_yaml.yaml_backend())
+    if json_to_yaml.SafeLoader is yaml.SafeLoader:
+        print("PyYAML isn't built with LibYAML, comparing pure Python to itself")
+    if args.fixtures:
+        fixtures = {
+            os.path.basename(path): load_fixture(path) for path in args.fixtures
+        }
+    else:
+        rnd = random.Random(1)
+        fixtures = {name: func(args.size, rnd) for name, func in FIXTURES.items()}
+    print(f"{'fixture':<12}{'backend':<10}{'MB':>8}{'dump s':>10}{'load s':>10}")
+    ok = True
+    for name, data in fixtures.items():
+        ok = run(name, data, args.repeat) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Check the startup cost of json_to_yaml.py --pretty and --reverse with
+`python -X importtime`, exit with 1 if it regressed.
+
+A path regresses if it imports a module it doesn't need (PyYAML for --pretty,
+the batch mode's modules for both), or if its imports take more than
+--max-ratio times as long as importing just the modules it needs, measured
+the same way. Modules already imported at interpreter startup (by site
+hooks) or by the needed modules don't count.
+
+Usage: bench_json_to_yaml_startup.py [--runs N] [--max-ratio R]
+"""
+import argparse
+import pathlib
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPT = pathlib.Path(__file__).resolve().parent.parent / "scripts" / "json_to_yaml.py"
+NEEDED = ["argparse", "functools", "itertools", "json", "os", "re", "sys"]
+BATCH_MODULES = {"glob", "multiprocessing", "tempfile"}
+# Path: (arguments, stdin, modules it needs, modules it must not import).
+PATHS = {
+    "--pretty": (["--pretty"], '{"a": [1, 2]}', NEEDED, BATCH_MODULES | {"yaml"}),
+    "--reverse": (["--reverse"], "a: [1, 2]\n", NEEDED + ["yaml"], BATCH_MODULES),
+}
+IMPORT_TIME_RE = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_time(argv, stdin):
+    """Run python -X importtime with argv, return the total import time in
+    seconds, the imported modules and the wall time."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv],
+        input=stdin,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    wall = time.perf_counter() - start
+    total = 0
+    modules = set()
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if match:
+            cumulative, indent, module = match.groups()
+            modules.add(module)
+            if not indent:
+                total += int(cumulative)
+    return total / 1e6, modules, wall
+
+
+def measure(argv, stdin, runs):
+    """Median import and wall time of runs, and the modules imported."""
+    results = [import_time(argv, stdin) for _ in range(runs)]
+    return (
+        statistics.median(total for total, _, _ in results),
+        results[0][1],
+        statistics.median(wall for _, _, wall in results),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--max-ratio", type=float, default=1.5)
+    args = parser.parse_args()
+    print(f"{'path':<12}{'imports ms':>12}{'needed ms':>12}{'ratio':>8}{'wall ms':>10}")
+    failures = []
+    for name, (arguments, stdin, needed, forbidden) in PATHS.items():
+        imports, modules, wall = measure([str(SCRIPT), *arguments], stdin, args.runs)
+        reference, reference_modules, _ = measure(
+            ["-c", "import " + ", ".join(needed)], "", args.runs
+        )
+        ratio = imports / reference
+        print(
+            f"{name:<12}{imports * 1e3:>12.1f}{reference * 1e3:>12.1f}"
+            f"{ratio:>8.2f}{wall * 1e3:>10.1f}"
+        )
+        extra = (modules - reference_modules) & forbidden
+        if extra:
+            failures.append(f"{name} imports {', '.join(sorted(extra))}")
+        if ratio > args.max_ratio:
+            failures.append(f"{name} imports take {ratio:.2f}x the needed modules")
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Benchmark the latency of the tmux keybinding scripts, _tmux_find_pane.py and
+_tmux_bg_task.py, against a fake tmux server (fake_tmux.py) and synthetic
+process trees, exit with 1 if a mode's p99 exceeds --max-p99.
+
+tmux runs them with run-shell, which gives up after 1s. Each mode is run
+--runs times (after --warmup runs, which start the _tmux_bg_task.py daemon)
+and reported with its p50, p99 and max wall time, the subprocesses the script
+started and the tmux clients started in total (including those of the
+daemon), per run.
+
+Each of the --panes panes runs a chain of --depth processes. Pane %0 is the
+current pane, its last line has the pid at the bottom of the last pane's
+chain for --find-pid, --pid looks up the same pid. The fake tmux is a Python
+script, so it starts slower than tmux, --delay adds a delay per reply.
+
+Usage: bench_tmux_scripts.py [--panes N] [--depth N] [--runs N] [-- mode ...]
+    e.g. bench_tmux_scripts.py --delay 5 -- --find-pid-all send-key
+"""
+import argparse
+import json
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+SCRIPTS_DIR = BENCH_DIR.parent / "scripts"
+FIND_PANE = str(SCRIPTS_DIR / "_tmux_find_pane.py")
+BG_TASK = str(SCRIPTS_DIR / "_tmux_bg_task.py")
+
+# Runs a script counting the subprocesses it starts, appended to
+# $BENCH_SPAWN_LOG at exit.
+WRAPPER = """
+import atexit, os, runpy, sys
+spawns = 0
+def hook(event, args):
+    global spawns
+    if event in ("subprocess.Popen", "os.posix_spawn", "os.fork"):
+        spawns += 1
+def log():
+    with open(os.environ["BENCH_SPAWN_LOG"], "a") as f:
+        f.write("%d\\n" % spawns)
+sys.addaudithook(hook)
+atexit.register(log)
+sys.argv = sys.argv[1:]
+sys.path[0] = os.path.dirname(sys.argv[0])
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+# Forks a chain of depth processes per pane, prints "root_pid leaf_pid" for
+# each pane and waits. All of them exit when stdin is closed. The last leaf
+# keeps the file argv[3] open.
+FOREST = """
+import os, sys
+panes, depth = int(sys.argv[1]), int(sys.argv[2])
+for pane in range(panes):
+    read, write = os.pipe()
+    if os.fork() == 0:
+        root = os.getpid()
+        for _ in range(depth - 1):
+            if os.fork():
+                break
+        else:
+            if pane == panes - 1:
+                held = open(sys.argv[3])
+            os.write(write, b"%d %d\\n" % (root, os.getpid()))
+        os.read(0, 1)
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as f:
+        sys.stdout.write(f.readline())
+sys.stdout.flush()
+os.read(0, 1)
+"""
+
+
+def modes(leaf_pid, path):
+    """Mode name -> arguments."""
+    return {
+        "--pid": [FIND_PANE, "-q", "--pid", str(leaf_pid)],
+        "--pid --no-cache": [FIND_PANE, "-q", "--no-cache", "--pid", str(leaf_pid)],
+        "--find-pid": [FIND_PANE, "-q", "--find-pid", "%0", "--mark-pane", "%1"],
+        "--find-pid-all": [FIND_PANE, "-q", "--find-pid-all"],
+        "--path": [FIND_PANE, "-q", "--path", str(path)],
+        "--mark-buffer-pane": [FIND_PANE, "-q", "--mark-buffer-pane"],
+        "send-key": [BG_TASK, "-q", "send-key", "--window", "@0", "--keys", "q"],
+        "reminder": [BG_TASK, "-q", "reminder", "--interval", "3600", "bench"],
+    }
+
+
+def start_forest(panes, depth, path):
+    """Start the process trees, return the process and (root, leaf) pids."""
+    proc = subprocess.Popen(
+        [sys.executable, "-c", FOREST, str(panes), str(depth), str(path)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    trees = [tuple(map(int, proc.stdout.readline().split())) for _ in range(panes)]
+    return proc, trees
+
+
+def write_config(path, trees, history, delay, log):
+    lines = ["$ make -j8 %d" % i for i in range(history)]
+    panes = [
+        {
+            "id": "%%%d" % i,
+            "pid": root,
+            "window": "@%d" % (i // 4),
+            "activity": 1700000000 + i,
+            "command": "bash",
+            "lines": lines,
+        }
+        for i, (root, _) in enumerate(trees)
+    ]
+    panes[0]["lines"] = lines + ["E325: ATTENTION", "process ID: %d" % trees[-1][1]]
+    config = {
+        "panes": panes,
+        "clients": ["/dev/pts/%d" % i for i in range(3)],
+        "buffers": {"last_pane": "%0"},
+        "delay": delay,
+        "log": str(log),
+    }
+    path.write_text(json.dumps(config))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+def run(argv, env, spawn_log, tmux_log):
+    """Run argv once, return its wall time, subprocesses and tmux clients."""
+    tmux_before = len(tmux_log.read_text().splitlines())
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", WRAPPER, *argv],
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    wall = time.perf_counter() - start
+    spawns = int(spawn_log.read_text().splitlines()[-1])
+    return wall, spawns, len(tmux_log.read_text().splitlines()) - tmux_before
+
+
+def stop_daemon(env):
+    """Kill the _tmux_bg_task.py daemon started by the benchmark, if any."""
+    proc = subprocess.run(
+        [sys.executable, BG_TASK, "tasks", "--stats"],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    )
+    for line in proc.stdout.splitlines():
+        name, _, value = line.partition(" ")
+        if name == "pid":
+            os.kill(int(value), signal.SIGTERM)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--panes", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=5, help="Processes per pane")
+    parser.add_argument(
+        "--history", type=int, default=200, help="Scrollback lines per pane"
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0, metavar="MS", help="Delay per tmux reply"
+    )
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--max-p99", type=float, default=1000, metavar="MS")
+    parser.add_argument("modes", nargs="*", help="Modes to run, default all")
+    args = parser.parse_args()
+    for mode in args.modes:
+        if mode not in modes(0, ""):
+            parser.error(
+                "unknown mode %r, one of: %s" % (mode, ", ".join(modes(0, "")))
+            )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        held_file = tmp / "held.db"
+        held_file.touch()
+        forest, trees = start_forest(args.panes, args.depth, held_file)
+        bin_dir = tmp / "bin"
+        bin_dir.mkdir()
+        (bin_dir / "tmux").symlink_to(BENCH_DIR / "fake_tmux.py")
+        tmux_log = tmp / "tmux.log"
+        tmux_log.touch()
+        spawn_log = tmp / "spawns.log"
+        write_config(
+            tmp / "config.json", trees, args.history, args.delay / 1e3, tmux_log
+        )
+        env = dict(
+            os.environ,
+            PATH="%s%s%s" % (bin_dir, os.pathsep, os.environ["PATH"]),
+            TMUX="%s,%d,0" % (tmp / "socket", os.getpid()),
+            XDG_RUNTIME_DIR=str(tmp),
+            FAKE_TMUX_CONFIG=str(tmp / "config.json"),
+            BENCH_SPAWN_LOG=str(spawn_log),
+        )
+        all_modes = modes(trees[-1][1], held_file)
+        print(
+            f"{args.panes} panes, {args.depth} processes each, "
+            f"{args.delay} ms per tmux reply"
+        )
+        print(
+            f"{'mode':<20}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+            f"{'spawns':>8}{'tmux':>6}"
+        )
+        failures = []
+        try:
+            for mode in args.modes or all_modes:
+                results = [
+                    run(all_modes[mode], env, spawn_log, tmux_log)
+                    for _ in range(args.warmup + args.runs)
+                ][args.warmup :]
+                walls = [wall * 1e3 for wall, _, _ in results]
+                p99 = percentile(walls, 0.99)
+                print(
+                    f"{mode:<20}{percentile(walls, 0.5):>9.1f}{p99:>9.1f}"
+                    f"{max(walls):>9.1f}{max(r[1] for r in results):>8}"
+                    f"{max(r[2] for r in results):>6}"
+                )
+                if p99 > args.max_p99:
+                    failures.append(f"{mode}: p99 {p99:.1f} ms > {args.max_p99} ms")
+        finally:
+            stop_daemon(env)
+            forest.stdin.close()
+            forest.wait()
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
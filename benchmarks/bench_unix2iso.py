@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Benchmark unix2iso.py throughput (MB/s) against the original line by line
+implementation, on a generated log file.
+
+With --json, compare converting whole lines to converting the "ts" field
+only (--field) on wide JSON lines.
+
+With --reverse, benchmark converting the output back to POSIX timestamps
+(--reverse) against time.strptime, and check that it round trips.
+
+Usage: bench_unix2iso.py [--json|--reverse] [--lines N] [--repeat N] [logfile]
+"""
+import argparse
+import fileinput
+import functools
+import io
+import json
+import os
+import pathlib
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "scripts"))
+
+import unix2iso  # noqa: E402
+
+NOW = int(time.time())
+LIMIT_PAST = NOW - 365 * 86400
+LIMIT_FUTURE = NOW + 30 * 86400
+FMT = "%Y-%m-%d %H:%M:%S%f"
+STRFTIME = functools.partial(time.strftime, "%Y-%m-%d %H:%M:%S")
+# The pattern before ms/µs/ns timestamps were supported.
+SECONDS_RE = re.compile(r"\b[123]\d{9}\b")
+
+
+def generate_log(path, lines):
+    """Write a log with about 10 lines per second from two sources, one of
+    them lagging 10 minutes behind, 10-digit ids that are partly within the
+    conversion window, and some lines without digits."""
+    rnd = random.Random(1)
+    ts = NOW - 10 * 86400
+    with open(path, "w") as f:
+        for i in range(lines):
+            if rnd.random() < 0.1:
+                ts += 1
+            if i % 5 == 0:
+                f.write("    continuation line without any numbers at all\n")
+            f.write(
+                f"{ts - 600 * (i % 2)} host{i % 7} request"
+                f" id={rnd.randint(10 ** 9, 4 * 10 ** 9)} status=200"
+                f" bytes={rnd.randint(0, 99999)} msg=some text here\n"
+            )
+
+
+def generate_json_log(path, lines):
+    """Write JSON lines with a "ts" field and many other fields, some of them
+    10-digit ids within the conversion window."""
+    rnd = random.Random(1)
+    ts = NOW - 10 * 86400
+    with open(path, "w") as f:
+        for i in range(lines):
+            if rnd.random() < 0.1:
+                ts += 1
+            record = {"ts": ts, "level": "info", "host": f"host{i % 7}"}
+            for n in range(20):
+                record[f"attr{n}"] = f"value {n} of a fairly wide record"
+            record["id"] = rnd.randint(10 ** 9, 4 * 10 ** 9)
+            record["msg"] = "some text here " * 5
+            f.write(json.dumps(record) + "\n")
+
+
+def legacy(filename, out):
+    """unix2iso.py main loop as it was before the Converter class."""
+
+    @functools.lru_cache(maxsize=128)
+    def _format(ts):
+        return STRFTIME(time.localtime(ts))
+
+    def _replace_timestamp(match):
+        timestamp = int(match[0])
+        if LIMIT_PAST <= timestamp <= LIMIT_FUTURE:
+            return _format(timestamp)
+        return match[0]
+
+    with fileinput.input(files=[filename]) as file_:
+        for line in file_:
+            print(re.sub(r"\b[123]\d{9}\b", _replace_timestamp, line), end="", file=out)
+
+
+def lines(filename, out):
+    converter = unix2iso.Converter(LIMIT_PAST, LIMIT_FUTURE, FMT, time.localtime)
+    with fileinput.input(files=[filename]) as file_:
+        for line in file_:
+            print(converter.convert(line), end="", file=out)
+
+
+def bulk(filename, out, pattern=unix2iso.TIMESTAMP_RE):
+    converter = unix2iso.Converter(
+        LIMIT_PAST, LIMIT_FUTURE, FMT, time.localtime, pattern
+    )
+    for block in unix2iso.read_blocks([filename]):
+        out.write(converter.convert(block))
+
+
+def bulk_seconds(filename, out):
+    """bulk with the seconds only pattern, to compare the cost of matching
+    ms/µs/ns timestamps too."""
+    bulk(filename, out, SECONDS_RE)
+
+
+def fields(filename, out):
+    converter = unix2iso.Converter(
+        LIMIT_PAST, LIMIT_FUTURE, FMT, time.localtime, fields=["ts"]
+    )
+    for block in unix2iso.read_blocks([filename]):
+        out.write(converter.convert(block))
+
+
+def parallel(filename, out):
+    unix2iso.convert_parallel(
+        [filename],
+        unix2iso.Converter,
+        (LIMIT_PAST, LIMIT_FUTURE, FMT, time.localtime),
+        0,
+        out,
+    )
+
+
+BENCHMARKS = {
+    "legacy": legacy,
+    "lines": lines,
+    "bulk-seconds": bulk_seconds,
+    "bulk": bulk,
+    "parallel": parallel,
+}
+JSON_BENCHMARKS = {"bulk": bulk, "fields": fields}
+
+
+def strptime(filename, out):
+    """Reverse conversion the straightforward way."""
+
+    def _replace(match):
+        return str(int(time.mktime(time.strptime(match[0], "%Y-%m-%d %H:%M:%S"))))
+
+    pattern = re.compile(r"\b\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\b")
+    for block in unix2iso.read_blocks([filename]):
+        out.write(pattern.sub(_replace, block))
+
+
+def reverse(filename, out):
+    converter = unix2iso.ReverseConverter(FMT, False, True)
+    for block in unix2iso.read_blocks([filename]):
+        out.write(converter.convert(block))
+
+
+REVERSE_BENCHMARKS = {"strptime": strptime, "reverse": reverse}
+
+
+def run(benchmarks, filename, repeat, compare=True, expected=None):
+    size = os.path.getsize(filename)
+    print(f"{'mode':<12}{'best s':>10}{'MB/s':>10}")
+    for name, func in benchmarks.items():
+        best = None
+        for _ in range(repeat):
+            out = io.StringIO()
+            start = time.perf_counter()
+            func(filename, out)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        output = out.getvalue()
+        if expected is None:
+            expected = output
+        elif compare and output != expected:
+            print(f"{name}: output differs")
+            return 1
+        print(f"{name:<12}{best:>10.3f}{size / best / 1e6:>10.1f}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--json", action="store_true", help="Benchmark --field")
+    parser.add_argument(
+        "--reverse", action="store_true", help="Benchmark --reverse"
+    )
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("logfile", nargs="?", help="Use this log instead")
+    args = parser.parse_args()
+    # Converting whole lines also converts the ids, so outputs differ.
+    benchmarks, compare = (JSON_BENCHMARKS, False) if args.json else (BENCHMARKS, True)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.logfile
+        if not path:
+            path = os.path.join(tmp, "test.log")
+            (generate_json_log if args.json else generate_log)(path, args.lines)
+        if not args.reverse:
+            return run(benchmarks, path, args.repeat, compare)
+        # Reverse the forward conversion, which should give back the input.
+        converted = os.path.join(tmp, "converted.log")
+        with open(converted, "w") as out:
+            bulk(path, out)
+        with open(path) as f:
+            return run(REVERSE_BENCHMARKS, converted, args.repeat, True, f.read())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
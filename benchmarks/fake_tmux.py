@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+r"""
+Stand-in for `tmux -C attach-session`, for benchmarking the tmux helper
+scripts without a tmux server. bench_tmux_scripts.py puts it on PATH as
+`tmux`.
+
+The server state is read from the JSON file in $FAKE_TMUX_CONFIG:
+    {
+        "panes": [{"id": "%0", "pid": 1234, "window": "@0", "activity": 1,
+                   "command": "bash", "lines": ["$ vim", ...]}, ...],
+        "clients": ["/dev/pts/1", ...],
+        "buffers": {"last_pane": "%0"},
+        "delay": 0.001,
+        "delays": {"capture-pane": 0.01},
+        "notifications": ["%window-add @1"],
+        "log": "/tmp/fake_tmux.log"
+    }
+
+Each reply is delayed by "delay" seconds, like a busy server, plus the
+"delays" of its command. The "notifications" lines are written before each
+reply. Commands that change the server state (set-buffer, select-pane,
+send-keys ...) succeed without changing anything, so every run of a benchmark
+sees the same state. Each invocation appends its argv to "log", to count the
+tmux clients started.
+"""
+import json
+import os
+import re
+import sys
+import time
+
+FORMAT_RE = re.compile(r"#\{(\w+)\}")
+OK_COMMANDS = {
+    "delete-buffer",
+    "refresh-client",
+    "select-pane",
+    "send-key",
+    "send-keys",
+    "set-buffer",
+    "set-environment",
+    "switch-client",
+}
+
+
+def parse_command(line):
+    """Split a command line written by _tmux_control.command_line().
+
+    Like tmux, a leading unescaped ~ is replaced by $HOME, also in double
+    quotes.
+    """
+    args = []
+    i = 0
+    while i < len(line):
+        if line[i] == " ":
+            i += 1
+            continue
+        quoted = line[i] == '"'
+        i += quoted
+        arg = []
+        if line[i] == "~":
+            arg.append(os.environ.get("HOME", "/"))
+            i += 1
+        while i < len(line) and line[i] != ('"' if quoted else " "):
+            if quoted and line[i] == "\\":
+                i += 1
+                arg.append("\n" if line[i] == "n" else line[i])
+            else:
+                arg.append(line[i])
+            i += 1
+        i += quoted
+        args.append("".join(arg))
+    return args
+
+
+def options(args):
+    """Return the -X value options and the remaining arguments of args."""
+    opts = {}
+    rest = []
+    args = iter(args)
+    for arg in args:
+        if arg == "--":
+            rest.extend(args)
+        elif arg in ("-b", "-c", "-d", "-F", "-S", "-t"):
+            opts[arg] = next(args)
+        elif arg.startswith("-") and len(arg) > 1:
+            opts[arg] = True
+        else:
+            rest.append(arg)
+    return opts, rest
+
+
+class FakeServer:
+    def __init__(self, config):
+        self.panes = {pane["id"]: pane for pane in config["panes"]}
+        self.clients = config.get("clients", [])
+        self.buffers = config.get("buffers", {})
+
+    def pane_vars(self, pane):
+        return {
+            "pane_id": pane["id"],
+            "pane_pid": pane["pid"],
+            "pane_marked": 0,
+            "pane_current_command": pane.get("command", "bash"),
+            "window_id": pane["window"],
+            "window_activity": pane.get("activity", 0),
+        }
+
+    def target_panes(self, target):
+        """Panes of target, a pane id or a window id, or all panes."""
+        if target is None:
+            return list(self.panes.values())
+        panes = [
+            pane
+            for pane in self.panes.values()
+            if target in (pane["id"], pane["window"])
+        ]
+        if not panes:
+            raise LookupError("can't find pane: %s" % target)
+        return panes
+
+    def run(self, args):
+        """Return the output lines of args, raise LookupError for %error."""
+        name, (opts, rest) = args[0], options(args[1:])
+        if name in OK_COMMANDS:
+            if name.startswith("send-key") or name == "select-pane":
+                self.target_panes(opts.get("-t"))
+            return []
+        if name in ("list-panes", "list-windows"):
+            panes = self.target_panes(None if "-a" in opts else opts.get("-t"))
+            if name == "list-windows":
+                panes = list({pane["window"]: pane for pane in panes}.values())
+            return [self.expand(opts["-F"], self.pane_vars(pane)) for pane in panes]
+        if name == "capture-pane":
+            lines = self.target_panes(opts.get("-t"))[0].get("lines", [])
+            start = int(opts.get("-S", 0))
+            return lines[start - 24 :] if start < 0 else lines[-24:]
+        if name == "display-message":
+            if "-p" not in opts:
+                return []
+            pane = self.target_panes(opts.get("-t"))[0]
+            return [self.expand(rest[0], self.pane_vars(pane))]
+        if name == "show-buffer":
+            if opts.get("-b") not in self.buffers:
+                raise LookupError("no buffer %s" % opts.get("-b"))
+            return self.buffers[opts["-b"]].splitlines()
+        if name == "list-clients":
+            # The control mode client running this command comes last.
+            clients = [(tty, "attached,focused,UTF-8") for tty in self.clients]
+            clients.append(("/dev/null", "attached,control-mode"))
+            return [
+                self.expand(opts["-F"], {"client_tty": tty, "client_flags": flags})
+                for tty, flags in clients
+            ]
+        raise LookupError("unknown command: %s" % name)
+
+    @staticmethod
+    def expand(fmt, variables):
+        return FORMAT_RE.sub(lambda match: str(variables.get(match[1], "")), fmt)
+
+
+def reply(number, output, error=False):
+    now = int(time.time())
+    lines = ["%%begin %d %d 1" % (now, number), *output]
+    lines.append("%s %d %d 1" % ("%error" if error else "%end", now, number))
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    with open(os.environ["FAKE_TMUX_CONFIG"]) as f:
+        config = json.load(f)
+    if config.get("log"):
+        with open(config["log"], "a") as f:
+            f.write(json.dumps(sys.argv[1:]) + "\n")
+    if sys.argv[1:3] != ["-C", "attach-session"]:
+        sys.exit("fake tmux only supports -C attach-session")
+    server = FakeServer(config)
+    delay = config.get("delay", 0)
+    delays = config.get("delays", {})
+    notifications = "".join(line + "\n" for line in config.get("notifications", []))
+    number = 0
+    reply(number, [])
+    for line in sys.stdin:
+        number += 1
+        args = parse_command(line.rstrip("\n"))
+        if delay or args[0] in delays:
+            time.sleep(delay + delays.get(args[0], 0))
+        sys.stdout.write(notifications)
+        try:
+            reply(number, server.run(args))
+        except (LookupError, ValueError) as e:
+            reply(number, [str(e)], error=True)
+    sys.stdout.write("%exit\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+r"""
+Minimal inotify(7) binding with ctypes, for the helper scripts that watch
+files without depending on a third-party package.
+
+Example:
+    with Inotify() as inotify:
+        inotify.add_watch(directory, IN_CLOSE_WRITE | IN_MOVED_TO)
+        selector.register(inotify, selectors.EVENT_READ)
+        ...
+        for event in inotify.read():
+            print(inotify.watches[event.wd], event.name)
+"""
+import collections
+import ctypes
+import ctypes.util
+import os
+import struct
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+Event = collections.namedtuple("Event", "wd mask cookie name")
+
+# struct inotify_event, followed by the name padded with NULs.
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """An inotify instance, its non-blocking file descriptor can be waited on
+    with select or asyncio's add_reader. `watches` maps watch descriptors
+    to the watched paths."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.watches = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, path, mask):
+        """Watch path for the events in mask, return the watch descriptor."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+        self.watches[wd] = path
+        return wd
+
+    def read(self):
+        """Return the pending events, an empty list if there are none."""
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            events.append(Event(wd, mask, cookie, name))
+        return events
@@ -1,44 +1,39 @@
 #!/usr/bin/env python3
 r"""
 Helper script for tmux config, to run tasks in background.
+
+reminder and send-key tasks are run by a daemon, which is started on demand
+and exits when it has no tasks left. It listens on a unix socket in the
+runtime dir, requests are one JSON object per connection with a "cmd" of:
+add, remove, list, stats or ping.
 """
 import argparse
+import asyncio
+import collections
+import heapq
+import itertools
+import json
 import logging as log
 import os
 import pathlib
-import signal
+import socket
 import subprocess
 import sys
 import time
 
 from xdg.BaseDirectory import get_runtime_dir
 
-DEBUG = int(os.environ.get("PDB_DEBUG", 0))
-
-
-class Pidfile:
-    file_prefix = "tmux_bg_sendkey"
+from _tmux_control import ControlClient, TmuxError
 
-    def __init__(self, window_id):
-        self.window_id = window_id
-
-    @property
-    def path(self):
-        return pathlib.Path(get_runtime_dir()) / f"{self.file_prefix}.{self.window_id}"
-
-    @classmethod
-    def from_path(cls, path: pathlib.Path):
-        window_id = path.name.replace(f"{cls.file_prefix}.", "")
-        return cls(window_id)
-
-    def store_pid(self):
-        self.path.write_text(str(os.getpid()))
+DEBUG = int(os.environ.get("PDB_DEBUG", 0))
+SOCKET_PREFIX = "tmux_bg_task"
+DAEMON_START_TIMEOUT = 2
+DAEMON_IDLE_TIMEOUT = 5
+RECONNECT_INTERVAL = 1
 
-    def read_pid(self):
-        return int(self.path.read_text().strip())
 
-    def remove(self):
-        self.path.unlink(missing_ok=True)
+class DaemonNotRunning(RuntimeError):
+    """No daemon listening on the control socket."""
 
 
 def main():
@@ -53,9 +48,11 @@ def main():
     )
     reminder = subs.add_parser("reminder", help="Periodic reminder")
     send = subs.add_parser("send-key", help="send-key to pane")
+    tasks = subs.add_parser("tasks", help="List reminder and send-key tasks")
+    daemon = subs.add_parser("daemon", help="Run background tasks (started on demand)")
 
     # Arguments and defaults common for all parsers
-    for p in parser, reminder, send:
+    for p in parser, reminder, send, tasks, daemon:
         p.set_defaults(log_level="INFO")
         p.add_argument(
             "-q", "--quiet", action="store_const", dest="log_level", const="WARNING"
@@ -69,9 +66,14 @@ def main():
             help="- for stdout. Default: %(default)s",
         )
 
-    reminder.set_defaults(func=_reminder)
+    reminder.set_defaults(func=_cmd_reminder)
     reminder.add_argument(
-        "--interval", type=int, required=True, metavar="seconds", help="Sleep interval"
+        "--kill",
+        metavar="task_id",
+        help="Stop reminder task_id (see `tasks`), or all reminders",
+    )
+    reminder.add_argument(
+        "--interval", type=int, metavar="seconds", help="Sleep interval"
     )
     reminder.add_argument(
         "--tmux-delay",
@@ -80,18 +82,17 @@ def main():
         metavar="seconds",
         help="display-message delay",
     )
-    reminder.add_argument("message")
+    reminder.add_argument("message", nargs="?")
 
     send.set_defaults(func=_cmd_send_key)
     send.add_argument("--window", required=True, help="tmux window")
     send.add_argument(
-        "--kill", action="store_true", help="Kill send-key process for specified window"
+        "--kill", action="store_true", help="Stop send-key task for specified window"
     )
     send.add_argument("--keys", nargs="*", help="Key(s) to send, accepts multiple args")
     send.add_argument(
         "--enter", action="store_true", help="Append enter/newline to keys"
     )
-    send.add_argument("--sleep-interval", type=int, default=10)
     send.add_argument(
         "--inactivity",
         type=int,
@@ -103,7 +104,17 @@ def main():
         "--pane-cmd", nargs="?", help="send-key only to panes running PANE_CMD"
     )
 
+    tasks.set_defaults(func=_cmd_tasks)
+    tasks.add_argument(
+        "--stats", action="store_true", help="Print daemon statistics instead"
+    )
+
+    daemon.set_defaults(func=_cmd_daemon)
+
     args = parser.parse_args()
+    if args.func is _cmd_reminder and not args.kill:
+        if not args.interval or not args.message:
+            reminder.error("--interval and message are required")
     kwargs = {"level": "DEBUG" if os.getenv("TMUX_VERBOSE") else args.log_level}
     if args.logfile != "-":
         kwargs["filename"] = args.logfile
@@ -118,7 +129,8 @@ def main():
 
 def _cmd_send_key(args):
     if args.kill:
-        _stop_sendkey(args.window)
+        removed = _remove_tasks("send-key", args.window)
+        log.info("Stopped send-key for window(s): %s", ", ".join(removed) or "none")
         return
     keys = args.keys or []
     if args.enter:
@@ -132,121 +144,642 @@ def _cmd_send_key(args):
         args.window,
         args.inactivity,
     )
-    pidfile = Pidfile(args.window)
-    pidfile.store_pid()
+    _add_task(
+        args,
+        {
+            "type": "send-key",
+            "window": args.window,
+            "keys": keys,
+            "inactivity": args.inactivity,
+            "pane_cmd": args.pane_cmd,
+        },
+    )
+
+
+def _cmd_reminder(args):
+    if args.kill:
+        removed = _remove_tasks("reminder", args.kill)
+        log.info("Stopped reminder(s): %s", ", ".join(removed) or "none")
+        return
+    reply = _add_task(
+        args,
+        {
+            "type": "reminder",
+            "interval": args.interval,
+            "tmux_delay": args.tmux_delay,
+            "message": args.message,
+        },
+    )
+    log.info("Added reminder %s every %s sec", reply["task"], args.interval)
+
+
+def _cmd_tasks(args):
     try:
-        while True:
-            if not _recent_window_activity(args.window, args.inactivity):
-                log.info(
-                    "No window_activity in %s in last %d seconds, send-key %s"
-                    " to panes with command %s",
-                    args.window,
-                    args.inactivity,
-                    keys,
-                    args.pane_cmd,
-                )
-                if not _send_key(keys, args.window, args.pane_cmd):
-                    log.warning("send-key failed, aborting")
-                    break
-            time.sleep(args.sleep_interval)
-            if not pidfile.path.exists():
-                log.info("Lock file %s doesn't exist, exiting...", pidfile.path)
-                return
-    except KeyboardInterrupt:
-        log.info("Caught SIGINT (probably by `send-key --kill`), exiting...")
-        pidfile.remove()
+        reply = _request({"cmd": "stats" if args.stats else "list"})
+    except DaemonNotRunning:
+        if args.stats:
+            raise
+        reply = {"tasks": []}
+    if args.stats:
+        for name, value in reply.items():
+            print(f"{name:<16}{value}")
         return
+    if not reply["tasks"]:
+        print("No tasks")
+    for task in reply["tasks"]:
+        if task["type"] == "reminder":
+            fmt = "{task:<14}reminder every {interval}s: {message}"
+        else:
+            fmt = (
+                "{task:<14}send-key keys={keys} pane_cmd={pane_cmd}"
+                " inactivity={inactivity}s next={next}"
+            )
+            task["next"] = time.strftime("%H:%M:%S", time.localtime(task["deadline"]))
+        print(fmt.format(**task))
 
 
-def _recent_window_activity(window: str, inactivity_time: int = 60):
-    """Return True if window's activity is more recent than last
-    inactivity_time seconds."""
-    proc = subprocess.run(
-        ["tmux", "list-panes", "-F", "#{window_activity}", "-t", window],
-        check=True,
-        timeout=1,
-        stdout=subprocess.PIPE,
-        text=True,
-    )
-    last_activity = proc.stdout.splitlines()[0]
-    ret = int(last_activity) > time.time() - inactivity_time
-    log.debug(
-        "Last activity time for %s: %s (%s). recent=%s",
-        window,
-        time.ctime(int(last_activity)),
-        last_activity,
-        ret,
+def _cmd_daemon(args):
+    path = _socket_path()
+    try:
+        asyncio.run(Daemon(ControlClient).run(path))
+    except KeyboardInterrupt:
+        log.info("Caught SIGINT, exiting...")
+
+
+def _socket_path():
+    # One daemon per tmux server, $TMUX is "socket_path,server_pid,session".
+    server_pid = os.environ["TMUX"].split(",")[1]
+    return pathlib.Path(get_runtime_dir()) / f"{SOCKET_PREFIX}.{server_pid}.sock"
+
+
+def _server_running():
+    # $TMUX is "socket_path,server_pid,session".
+    server_pid = int(os.environ["TMUX"].split(",")[1])
+    try:
+        os.kill(server_pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    try:
+        # A server that exited stays a zombie until it's reaped, e.g. never in
+        # a container without an init process.
+        with open(f"/proc/{server_pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return True
+
+
+def _add_task(args, task):
+    message = {"cmd": "add", **task}
+    try:
+        return _request(message)
+    except DaemonNotRunning:
+        _start_daemon(args)
+        return _request(message)
+
+
+def _remove_tasks(task_type, task_id):
+    """Stop task_id (or "all") of task_type, return the stopped task ids."""
+    try:
+        reply = _request({"cmd": "remove", "type": task_type, "task": task_id})
+    except DaemonNotRunning:
+        # No daemon, no tasks.
+        if task_type == "reminder" and task_id != "all":
+            raise RuntimeError(f"No reminder '{task_id}'")
+        return []
+    return reply["removed"]
+
+
+def _start_daemon(args):
+    log.info("Starting tmux_bg_task daemon")
+    cmd = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "daemon",
+        "--logfile",
+        args.logfile,
+    ]
+    if args.log_level == "DEBUG":
+        cmd.append("--verbose")
+    elif args.log_level == "WARNING":
+        cmd.append("--quiet")
+    subprocess.Popen(
+        cmd,
+        start_new_session=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
     )
-    return ret
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        try:
+            _request({"cmd": "ping"})
+            return
+        except DaemonNotRunning:
+            pass
+    raise RuntimeError("tmux_bg_task daemon didn't start, see log")
+
+
+def _request(message):
+    """Send message to the daemon and return its reply."""
+    path = _socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(DAEMON_START_TIMEOUT)
+        try:
+            sock.connect(str(path))
+        except (FileNotFoundError, ConnectionRefusedError):
+            raise DaemonNotRunning(f"No tmux_bg_task daemon listening on {path}")
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            reply = json.loads(f.readline())
+    log.debug("Request %s, reply: %s", message, reply)
+    if "error" in reply:
+        raise RuntimeError(reply["error"])
+    return reply
+
+
+class Watch:
+    """send-key task for one window."""
+
+    def __init__(self, window_id, keys, inactivity, pane_cmd, activity):
+        self.window_id = window_id
+        self.keys = keys
+        self.inactivity = inactivity
+        self.pane_cmd = pane_cmd
+        self.activity = activity
+
+    @property
+    def deadline(self):
+        return self.activity + self.inactivity
+
+    def describe(self):
+        return {
+            "type": "send-key",
+            "task": self.window_id,
+            "keys": self.keys,
+            "inactivity": self.inactivity,
+            "pane_cmd": self.pane_cmd,
+            "deadline": self.deadline,
+        }
+
+
+class Reminder:
+    """Periodic display-message to all focused clients."""
+
+    def __init__(self, task_id, interval, tmux_delay, message):
+        self.task_id = task_id
+        self.interval = interval
+        self.tmux_delay = tmux_delay
+        self.message = message
+        self.task = None
+
+    def describe(self):
+        return {
+            "type": "reminder",
+            "task": self.task_id,
+            "interval": self.interval,
+            "message": self.message,
+        }
+
+
+class Daemon:
+    """Run all reminder and send-key tasks in one asyncio loop, over one tmux
+    control mode connection.
+
+    Each reminder is an asyncio task sleeping for its interval. send-key
+    tasks have a timer at the window's last activity + inactivity time, kept
+    in a heap ordered by deadline. Activity notifications for windows in the
+    attached session move the timers forward as they arrive, when a timer
+    expires the activity of all windows is checked with a single
+    list-windows before keys are sent.
+
+    `tmux -C attach-session` attaches to the most recently used session,
+    which goes away with that session. The daemon then reconnects with
+    connect() (attaching to another session) and keeps its tasks, it only
+    exits when the tmux server is gone.
+    """
+
+    def __init__(self, connect):
+        self.connect = connect
+        self.tmux = None
+        self.next_reconnect = 0
+        self.watches = {}
+        self.reminders = {}
+        self.timers = []
+        self.reminder_ids = itertools.count(1)
+        self.idle_since = time.monotonic()
+        self.started = time.time()
+        self.running = True
+        self.wakeup = None
+        self.stats = collections.Counter()
+
+    async def run(self, path):
+        self.wakeup = asyncio.Event()
+        self.tmux = self.connect()
+        try:
+            server = await self._listen(path)
+            if not server:
+                log.info("Daemon already listening on %s", path)
+                return
+            log.info("Daemon listening on %s", path)
+            # A new daemon may bind path once this one stopped listening, its
+            # socket must not be removed.
+            inode = path.stat().st_ino
+            self._subscribe()
+            try:
+                async with server:
+                    await self._run_timers()
+            finally:
+                for reminder in self.reminders.values():
+                    reminder.task.cancel()
+                try:
+                    if path.stat().st_ino == inode:
+                        path.unlink()
+                except FileNotFoundError:
+                    pass
+        finally:
+            if self.tmux:
+                self._disconnect()
+
+    async def _listen(self, path):
+        """Return a server listening at path, or None if another daemon is
+        already listening there."""
+        if path.exists():
+            try:
+                reader, writer = await asyncio.open_unix_connection(str(path))
+            except (FileNotFoundError, ConnectionRefusedError):
+                log.info("Removing stale socket %s", path)
+                path.unlink(missing_ok=True)
+            else:
+                writer.close()
+                return None
+        return await asyncio.start_unix_server(self._handle_connection, str(path))
+
+    async def _run_timers(self):
+        while self.running:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self._timeout())
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if self._connected():
+                try:
+                    self._expire()
+                    self._handle_notifications()
+                except TmuxError as e:
+                    log.error("Lost tmux control connection: %s", e)
+                    self._disconnect()
+            if self._idle():
+                log.info("No tasks left, exiting")
+                break
 
+    def _idle(self):
+        return (
+            not self.watches
+            and not self.reminders
+            and time.monotonic() - self.idle_since > DAEMON_IDLE_TIMEOUT
+        )
 
-def _send_key(keys, window, pane_cmd=None):
-    proc = subprocess.run(
-        [
-            "tmux",
-            "list-panes",
-            "-F",
-            "#{pane_id}|#{pane_current_command}",
+    def _timeout(self):
+        if self.tmux is None:
+            return max(self.next_reconnect - time.monotonic(), 0)
+        if self.timers:
+            return max(self.timers[0][0] - time.time(), 0)
+        return max(self.idle_since + DAEMON_IDLE_TIMEOUT - time.monotonic(), 0)
+
+    def _subscribe(self):
+        # Not supported before tmux 3.2, timers are still checked on expiry.
+        self.tmux.pipeline([("refresh-client", "-B", "activity:@*:#{window_activity}")])
+        asyncio.get_running_loop().add_reader(
+            self.tmux.fileno(), self._read_notifications
+        )
+
+    def _disconnect(self):
+        asyncio.get_running_loop().remove_reader(self.tmux.fileno())
+        self.tmux.close()
+        self.tmux = None
+        self.wakeup.set()
+
+    def _connected(self):
+        """Return whether the control connection is up, reconnect at most
+        every RECONNECT_INTERVAL seconds if it isn't. Stop the daemon if the
+        tmux server is gone."""
+        if self.tmux is not None:
+            return True
+        if time.monotonic() < self.next_reconnect:
+            return False
+        # Checked first, attach-session would start a new server on the same
+        # socket, or attach to one started since.
+        if not _server_running():
+            log.info("tmux server is gone, exiting")
+            self.running = False
+            return False
+        try:
+            self.tmux = self.connect()
+        except (OSError, TmuxError) as e:
+            log.warning("Reconnecting to tmux failed: %s", e)
+            self.next_reconnect = time.monotonic() + RECONNECT_INTERVAL
+            return False
+        log.info("Reconnected to tmux")
+        self.stats["reconnects"] += 1
+        self._subscribe()
+        # Timers popped while the connection was failing are lost.
+        for watch in self.watches.values():
+            heapq.heappush(self.timers, (watch.deadline, watch.window_id))
+        return True
+
+    def _require_tmux(self):
+        if not self._connected():
+            raise RuntimeError("Not connected to tmux, try again")
+        return self.tmux
+
+    def _schedule(self, watch):
+        if not self.timers or watch.deadline < self.timers[0][0]:
+            self.wakeup.set()
+        heapq.heappush(self.timers, (watch.deadline, watch.window_id))
+
+    def _remove(self, tasks, task_id):
+        """Remove task_id from tasks, self.reminders or self.watches."""
+        task = tasks.pop(task_id)
+        if isinstance(task, Reminder):
+            task.task.cancel()
+        if not self.watches and not self.reminders:
+            self.idle_since = time.monotonic()
+            self.wakeup.set()
+
+    def _read_notifications(self):
+        if self.tmux is None:
+            return
+        try:
+            self._handle_notifications()
+        except TmuxError as e:
+            log.error("Lost tmux control connection: %s", e)
+            self._disconnect()
+
+    def _handle_notifications(self):
+        while self.tmux and (line := self.tmux.read_notification(0)) is not None:
+            self.stats["notifications"] += 1
+            if line.startswith("%subscription-changed activity "):
+                # %subscription-changed name $session @window index - : value
+                fields, value = line.split(" : ", 1)
+                watch = self.watches.get(fields.split()[3])
+                if watch and int(value) > watch.activity:
+                    watch.activity = int(value)
+                    self._schedule(watch)
+            elif line.startswith("%window-close "):
+                window_id = line.split()[1]
+                if window_id in self.watches:
+                    log.info("Window %s closed, removing send-key task", window_id)
+                    self._remove(self.watches, window_id)
+            elif line.startswith("%exit"):
+                # The attached session was killed, the tasks are kept.
+                log.info("tmux control client exited: %s", line)
+                self._disconnect()
+
+    def _expire(self):
+        now = time.time()
+        expired = []
+        while self.timers and self.timers[0][0] <= now:
+            deadline, window_id = heapq.heappop(self.timers)
+            watch = self.watches.get(window_id)
+            # Stale heap entries are skipped, a watch is rescheduled by
+            # pushing a new entry.
+            if watch and watch.deadline == deadline and watch not in expired:
+                expired.append(watch)
+        if not expired:
+            return
+        self.stats["timers_expired"] += len(expired)
+        self.stats["activity_checks"] += 1
+        activity = self._window_activity()
+        for watch in expired:
+            if watch.window_id not in activity:
+                log.info("Window %s is gone, removing send-key task", watch.window_id)
+                self._remove(self.watches, watch.window_id)
+                continue
+            watch.activity = max(watch.activity, activity[watch.window_id])
+            if watch.deadline <= now:
+                log.info(
+                    "No window_activity in %s in last %d seconds, send-key %s"
+                    " to panes with command %s",
+                    watch.window_id,
+                    watch.inactivity,
+                    watch.keys,
+                    watch.pane_cmd,
+                )
+                if not _send_key(
+                    self.tmux, watch.keys, watch.window_id, watch.pane_cmd
+                ):
+                    log.warning("send-key to %s failed, removing task", watch.window_id)
+                    self.stats["send_key_failures"] += 1
+                    self._remove(self.watches, watch.window_id)
+                    continue
+                self.stats["send_keys"] += 1
+                watch.activity = now
+            self._schedule(watch)
+
+    def _window_activity(self):
+        activity = {}
+        for line in self.tmux.command(
+            "list-windows", "-a", "-F", "#{window_id} #{window_activity}"
+        ):
+            window_id, last_activity = line.split()
+            activity[window_id] = int(last_activity)
+        return activity
+
+    async def _run_reminder(self, reminder):
+        while True:
+            await asyncio.sleep(reminder.interval)
+            try:
+                self._display_message(reminder)
+            except RuntimeError as e:
+                log.error("Reminder %s failed: %s", reminder.task_id, e)
+            self._read_notifications()
+
+    def _display_message(self, reminder):
+        tmux = self._require_tmux()
+        clients = list(_get_clients(tmux, "attached", "focused"))
+        # All display-messages are written before any reply is read.
+        replies = tmux.pipeline(
+            [
+                (
+                    "display-message",
+                    "-c",
+                    client_tty,
+                    "-d",
+                    str(reminder.tmux_delay),
+                    reminder.message,
+                )
+                for client_tty in clients
+            ]
+        )
+        sent_to = []
+        for client_tty, reply in zip(clients, replies):
+            if reply.error:
+                log.warning(
+                    "display-message to %s failed: %s",
+                    client_tty,
+                    "\n".join(reply.output),
+                )
+            else:
+                sent_to.append(client_tty)
+        self.stats["reminders_sent"] += 1
+        log.info("Sent message to tmux clients: %s", ", ".join(sent_to))
+        if not sent_to:
+            log.error("Did not get any attached tmux clients to send to")
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            message = json.loads(await asyncio.wait_for(reader.readline(), 1))
+            try:
+                reply = self._handle(message)
+            except RuntimeError as e:
+                reply = {"error": str(e)}
+            writer.write(json.dumps(reply).encode() + b"\n")
+            await writer.drain()
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            log.warning("Bad request: %s", e)
+        finally:
+            writer.close()
+        self._read_notifications()
+
+    def _handle(self, message):
+        log.debug("Request: %s", message)
+        cmd = message.get("cmd")
+        self.stats["requests"] += 1
+        if cmd == "ping":
+            return {}
+        if cmd == "list":
+            return {
+                "tasks": [
+                    task.describe()
+                    for task in itertools.chain(
+                        self.reminders.values(), self.watches.values()
+                    )
+                ]
+            }
+        if cmd == "stats":
+            return {
+                "pid": os.getpid(),
+                "uptime": int(time.time() - self.started),
+                "reminders": len(self.reminders),
+                "send_key_tasks": len(self.watches),
+                "timers": len(self.timers),
+                **self.stats,
+            }
+        if cmd == "add" and message.get("type") == "reminder":
+            return self._add_reminder(message)
+        if cmd == "add":
+            return self._add_watch(message)
+        if cmd == "remove":
+            tasks = self.reminders if message["type"] == "reminder" else self.watches
+            if message["task"] == "all":
+                removed = list(tasks)
+            elif message["task"] in tasks:
+                removed = [message["task"]]
+            elif message["type"] == "send-key":
+                removed = [self._window_id(message["task"])]
+            else:
+                raise RuntimeError(f"No reminder '{message['task']}'")
+            for task_id in removed:
+                log.info("Removing task %s", task_id)
+                self._remove(tasks, task_id)
+            return {"removed": removed}
+        raise RuntimeError(f"Unknown command: {cmd!r}")
+
+    def _add_reminder(self, message):
+        reminder = Reminder(
+            f"reminder-{next(self.reminder_ids)}",
+            message["interval"],
+            message["tmux_delay"],
+            message["message"],
+        )
+        log.info(
+            "Reminder %s every %s sec: %r",
+            reminder.task_id,
+            reminder.interval,
+            reminder.message,
+        )
+        reminder.task = asyncio.create_task(self._run_reminder(reminder))
+        self.reminders[reminder.task_id] = reminder
+        return {"task": reminder.task_id}
+
+    def _add_watch(self, message):
+        tmux = self._require_tmux()
+        window_id, activity = tmux.command(
+            "display-message",
+            "-p",
             "-t",
-            window,
-        ],
-        check=True,
-        timeout=1,
-        stdout=subprocess.PIPE,
-        text=True,
+            message["window"],
+            "#{window_id} #{window_activity}",
+        )[0].split()
+        watch = Watch(
+            window_id,
+            message["keys"],
+            message["inactivity"],
+            message["pane_cmd"],
+            int(activity),
+        )
+        log.info(
+            "Send key %r to pane(s) with cmd %r in window %s after %s sec"
+            " inactivity",
+            watch.keys,
+            watch.pane_cmd,
+            window_id,
+            watch.inactivity,
+        )
+        self.watches[window_id] = watch
+        self._schedule(watch)
+        return {"task": window_id}
+
+    def _window_id(self, window):
+        """Resolve window to a watched window id."""
+        reply = self._require_tmux().pipeline(
+            [("display-message", "-p", "-t", window, "#{window_id}")]
+        )[0]
+        if not reply.error and reply.output[0] in self.watches:
+            return reply.output[0]
+        raise RuntimeError(f"No task for '{window}'")
+
+
+def _send_key(tmux, keys, window, pane_cmd=None):
+    output = tmux.command(
+        "list-panes", "-F", "#{pane_id}|#{pane_current_command}", "-t", window
     )
-    retvals = 0
-    for line in proc.stdout.splitlines():
+    pane_ids = []
+    for line in output:
         pane_id, pane_current_command = line.split("|", maxsplit=1)
         if pane_cmd and pane_cmd != pane_current_command:
             continue
         log.debug(
             "send-key to pane %r running command %r", pane_id, pane_current_command
         )
-        proc = subprocess.run(["tmux", "send-key", "-t", pane_id] + keys, timeout=1)
-        retvals += proc.returncode
-    return retvals == 0
-
-
-def _stop_sendkey(window_id):
-    if window_id != "all":
-        pidfile = Pidfile(window_id)
-        _kill_pid(pidfile)
-        return
-
-    for lockfile in pathlib.Path(get_runtime_dir()).glob("tmux_bg_sendkey.*"):
-        log.info("Found lockfile %s, attempt to kill the process owning it", lockfile)
-        pidfile = Pidfile.from_path(lockfile)
-        _kill_pid(pidfile)
-    return
-
-
-def _kill_pid(pidfile: Pidfile):
-    try:
-        pid = pidfile.read_pid()
-    except FileNotFoundError:
-        raise RuntimeError(
-            "No stored pid for tmux window '{}' ({})".format(
-                pidfile.window_id, pidfile.path
+        pane_ids.append(pane_id)
+    # One write for all panes, a reply per pane is read back after.
+    replies = tmux.pipeline(
+        [["send-key", "-t", pane_id] + keys for pane_id in pane_ids]
+    )
+    failed = 0
+    for pane_id, reply in zip(pane_ids, replies):
+        if reply.error:
+            log.warning(
+                "send-key to pane %s failed: %s", pane_id, "\n".join(reply.output)
             )
-        )
-    log.debug("Send SIGINT to %s", pid)
-    os.kill(pid, signal.SIGINT)
+            failed += 1
+    return failed == 0
 
 
-def _get_clients(*flags):
+def _get_clients(tmux, *flags):
     """Get tmux clients with the flags in *flags."""
-    proc = subprocess.run(
-        ["tmux", "list-clients", "-F", "#{client_tty}|#{client_flags}"],
-        check=True,
-        timeout=1,
-        stdout=subprocess.PIPE,
-        text=True,
-    )
-    for line in proc.stdout.splitlines():
+    output = tmux.command("list-clients", "-F", "#{client_tty}|#{client_flags}")
+    for line in output:
         log.debug("_get_clients %r", line)
         tty, flag_str = line.split("|", maxsplit=1)
         client_flags = set(flag_str.split(","))
+        if "control-mode" in client_flags:
+            # Our own connection, or another script's.
+            continue
         for flag in flags:
             if flag not in client_flags:
                 break
@@ -255,31 +788,6 @@ def _get_clients(*flags):
             yield tty
 
 
-def _reminder(args):
-    while True:
-        time.sleep(args.interval)
-        sent_to = []
-        for client_tty in _get_clients("attached", "focused"):
-            sent_to.append(client_tty)
-            subprocess.run(
-                [
-                    "tmux",
-                    "display-message",
-                    "-c",
-                    client_tty,
-                    "-d",
-                    str(args.tmux_delay),
-                    args.message,
-                ],
-                check=True,
-                timeout=1,
-                text=True,
-            )
-        log.info("Sent message to tmux clients: %s", ", ".join(sent_to))
-        if not sent_to:
-            log.error("Did not get any attached tmux clients to send to")
-
-
 if __name__ == "__main__":
     try:
         main()
@@ -0,0 +1,176 @@
+r"""
+Client for a tmux control mode (`tmux -C`) connection, shared by the tmux
+helper scripts.
+
+One tmux client process is started per connection, commands are written as
+lines to its stdin and each reply is read back as a `%begin` ... `%end` (or
+`%error`) block. Several commands can be written before reading any replies
+(see `ControlClient.pipeline`).
+
+Example:
+    with ControlClient() as tmux:
+        panes = tmux.command("list-panes", "-a", "-F", "#{pane_id}")
+"""
+import collections
+import os
+import selectors
+import subprocess
+import time
+
+# -E: attaching applies update-environment to the session, which would replace
+# e.g. its SSH_AUTH_SOCK and DISPLAY with the (possibly stale) values of the
+# script's environment. A control client doesn't resize windows until it sets
+# a size with refresh-client -C, so no -f ignore-size (tmux >= 3.2) is needed.
+DEFAULT_ARGV = ("tmux", "-C", "attach-session", "-E")
+
+Reply = collections.namedtuple("Reply", "output error")
+
+
+class TmuxError(RuntimeError):
+    """tmux replied with %error, or the control connection failed."""
+
+
+def quote(arg):
+    """Quote arg for the tmux command parser."""
+    arg = (
+        str(arg)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("$", "\\$")
+        .replace("\n", "\\n")
+    )
+    if arg.startswith("~"):
+        # A leading ~ is expanded to a home directory even in double quotes.
+        arg = "\\" + arg
+    return '"{}"'.format(arg)
+
+
+def command_line(args):
+    return " ".join(quote(arg) for arg in args)
+
+
+class ControlClient:
+    """A control mode connection to the tmux server.
+
+    argv is the command starting the control mode client, replace it to talk
+    to a fake server over the same pipes. Notifications (`%output`,
+    `%window-add` etc.) received between replies are kept in
+    `notifications`. Pane output isn't sent unless output=True, so an idle
+    connection doesn't fill up the pipe.
+    """
+
+    def __init__(self, cmd_timeout=1, argv=DEFAULT_ARGV, output=False):
+        self.cmd_timeout = cmd_timeout
+        self.notifications = collections.deque(maxlen=1000)
+        self._buffer = b""
+        self._proc = subprocess.Popen(
+            list(argv),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._proc.stdout, selectors.EVENT_READ)
+        try:
+            # Reply to the command tmux -C was started with (attach-session).
+            reply = self._read_reply(time.monotonic() + cmd_timeout)
+        except Exception:
+            self.close()
+            raise
+        if reply.error:
+            self.close()
+            raise TmuxError("\n".join(reply.output) or "control mode client failed")
+        if not output:
+            # Not supported before tmux 3.2, where output is just drained
+            # with the replies.
+            self.pipeline([("refresh-client", "-f", "no-output")])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def fileno(self):
+        """File descriptor to wait on for notifications."""
+        return self._proc.stdout.fileno()
+
+    def close(self):
+        if self._proc.stdout.closed:
+            return
+        self._selector.close()
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=self.cmd_timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self._proc.kill()
+            self._proc.wait()
+        self._proc.stdout.close()
+
+    def command(self, *args):
+        """Run one tmux command and return its output lines, raise TmuxError
+        if tmux reports an error."""
+        reply = self.pipeline([args])[0]
+        if reply.error:
+            raise TmuxError(
+                "tmux {}: {}".format(args[0], "\n".join(reply.output) or "failed")
+            )
+        return reply.output
+
+    def pipeline(self, commands):
+        """Write all commands before reading the replies, return a Reply per
+        command in the same order."""
+        commands = list(commands)
+        if not commands:
+            return []
+        data = "".join(command_line(args) + "\n" for args in commands)
+        try:
+            self._proc.stdin.write(data.encode())
+            self._proc.stdin.flush()
+        except OSError as e:
+            raise TmuxError("control mode connection lost: %s" % e)
+        deadline = time.monotonic() + self.cmd_timeout * len(commands)
+        return [self._read_reply(deadline) for _ in commands]
+
+    def read_notification(self, timeout=None):
+        """Return the next notification line, or None if nothing arrived
+        within timeout seconds."""
+        if self.notifications:
+            return self.notifications.popleft()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        line = self._readline(deadline, raise_timeout=False)
+        if line is not None and line.startswith("%begin"):
+            raise TmuxError("unexpected reply: %s" % line)
+        return line
+
+    def _read_reply(self, deadline):
+        output = None
+        while True:
+            line = self._readline(deadline)
+            if output is None:
+                if line.startswith("%begin"):
+                    output = []
+                elif line.startswith("%exit"):
+                    raise TmuxError("control mode client exited: %s" % line)
+                else:
+                    self.notifications.append(line)
+            elif line.startswith(("%end", "%error")):
+                return Reply(output, line.startswith("%error"))
+            else:
+                output.append(line)
+
+    def _readline(self, deadline, raise_timeout=True):
+        while b"\n" not in self._buffer:
+            timeout = None
+            if deadline is not None:
+                timeout = max(deadline - time.monotonic(), 0)
+                if not self._selector.select(timeout):
+                    if raise_timeout:
+                        raise TmuxError("timeout waiting for tmux reply")
+                    return None
+            chunk = os.read(self.fileno(), 65536)
+            if not chunk:
+                raise TmuxError("control mode connection closed")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode(errors="replace")
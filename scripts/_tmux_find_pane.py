@@ -11,19 +11,32 @@ Usage:
         - "run-shell '_tmux_find_pane.py --find-pid #{pane_id} -q --mark-pane #{pane_id}'; \
             switchc -t \"{marked}\"; \
             run-shell '_tmux_find_pane.py -q --mark-env-pane'"
+        - Or search the scrollback of all panes and use the newest match with
+        `--find-pid-all` instead of `--find-pid #{pane_id}`.
 
     * enter pid manually:
 
+    * find the panes using a file or directory (open by, or the cwd of, one of
+    their processes), like a locked database or a busy mount point:
+        `_tmux_find_pane.py --path ~/db.sqlite`
+
     * Locate the tmux pane parenting the pid.
     * Do a switch-client to that pane (previous pane will be marked).
     * `prefix '` to get back (switchc -t '{marked}').
 
+The pane of each pid looked up is cached in $XDG_RUNTIME_DIR, so looking up
+the same process again skips reading the process table.
+
 """
 import argparse
+import json
 import os
 import re
 import subprocess
 import sys
+import tempfile
+
+from _tmux_control import ControlClient, TmuxError
 
 if sys.version_info < (3, 5):
     print("Python version >= 3.5 is required. Current version:\n" + sys.version)
@@ -31,80 +44,348 @@ if sys.version_info < (3, 5):
 
 DEBUG = int(os.environ.get("PDB_DEBUG", 0))
 BUFFER_NAME = "last_pane"
+PROC_DIR = "/proc"
+CACHE_PREFIX = "tmux_find_pane"
+MAX_CACHE_ENTRIES = 256
+# E.g. "process ID: 1234" in a vim swapfile warning, or "pid 1234".
+PID_RE = re.compile(r"(?:process (?:id)|pid).{1,3}?(\b\d{2,}\b)", re.I)
 
 
-class Panes:
+class ProcessTable:
+    """Snapshot of the pid -> ppid relation of all processes.
+
+    Read from /proc/*/stat in one pass, with a single `ps` call as fallback
+    where /proc isn't available.
+    """
+
     def __init__(self, cmd_timeout):
-        proc = subprocess.run(
-            ["tmux", "list-panes", "-a", "-F", "#{pane_pid}:#{pane_id}:#{pane_marked}"],
-            check=True,
-            universal_newlines=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=cmd_timeout,
-        )
         self.cmd_timeout = cmd_timeout
-        self.pids = {}
-        self.marked_pane = ""
-        for line in proc.stdout.splitlines():
-            pid, pane_id, marked = line.split(":")
-            self.pids[int(pid)] = pane_id
-            if marked == "1":
-                assert self.marked_pane == ""
-                self.marked_pane = pane_id
+        if os.path.isdir(os.path.join(PROC_DIR, "self")):
+            self.ppids = self._read_proc()
+        else:
+            self.ppids = self._read_ps()
 
-    def get_tmux_pane(self, pid):
-        """Return the pane id owning the child process pid by recursively
-        checking pids parent processes."""
-        if pid in self.pids:
-            return self.pids[pid]
-        if pid < 100:
-            raise RuntimeError("given pid doesn't belong to tmux server")
+    @staticmethod
+    def _read_proc():
+        ppids = {}
+        for entry in os.listdir(PROC_DIR):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(os.path.join(PROC_DIR, entry, "stat"), "rb") as f:
+                    stat = f.read()
+            except OSError:
+                # Process exited after listdir.
+                continue
+            # The comm field is in parentheses and may contain anything,
+            # ppid is the second field after the last ")".
+            ppids[int(entry)] = int(stat[stat.rindex(b")") + 2 :].split(None, 2)[1])
+        return ppids
+
+    def _read_ps(self):
         proc = subprocess.run(
-            ["ps", "--format", "ppid=", "--pid", str(pid)],
+            ["ps", "--format", "pid=,ppid=", "ax"],
             check=True,
             universal_newlines=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             timeout=self.cmd_timeout,
         )
-        ppid = int(proc.stdout.strip())
-        return self.get_tmux_pane(ppid)
+        ppids = {}
+        for line in proc.stdout.splitlines():
+            pid, ppid = line.split()
+            ppids[int(pid)] = int(ppid)
+        return ppids
 
+    def ancestors(self, pid):
+        """Yield pid and each of its ancestors, nearest first."""
+        while pid in self.ppids:
+            yield pid
+            pid = self.ppids[pid]
 
-class Pids:
-    def __init__(self, cmd_timeout):
-        proc = subprocess.run(
-            ["ps", "--format", "pid=", "ax"],
-            check=True,
-            universal_newlines=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=cmd_timeout,
-        )
+
+def start_time(pid):
+    """Return the start time of pid from /proc/<pid>/stat, which tells it
+    apart from later processes reusing the pid, or None if it isn't
+    running."""
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "stat"), "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # starttime is field 22, the 20th after the comm field.
+    return int(stat[stat.rindex(b")") + 2 :].split()[19])
+
+
+class PaneCache:
+    """pid -> pane id of the earlier lookups, stored per tmux server in the
+    XDG runtime dir.
+
+    An entry is valid while its process has the same start time and its pane
+    the same pane pid. Invalid entries are evicted when the cache is saved.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @classmethod
+    def for_server(cls):
+        """Return the cache of the current tmux server, or None without
+        /proc, pyxdg or a runtime dir."""
+        if not os.path.isdir(os.path.join(PROC_DIR, "self")):
+            return None
+        try:
+            # Not installed by install_tools, the cache is optional.
+            from xdg.BaseDirectory import get_runtime_dir
+
+            runtime_dir = get_runtime_dir()
+        except (ImportError, KeyError):
+            # KeyError: $XDG_RUNTIME_DIR isn't set.
+            return None
+        # $TMUX is "socket_path,server_pid,session".
+        server_pid = os.environ["TMUX"].split(",")[1]
+        return cls(os.path.join(runtime_dir, "%s.%s.json" % (CACHE_PREFIX, server_pid)))
+
+    def get(self, pid, panes):
+        """Return the cached pane id of pid, or None."""
+        entry = self.entries.get(str(pid))
+        if entry is None:
+            return None
+        if self._is_valid(pid, entry, panes):
+            return entry[2]
+        del self.entries[str(pid)]
+        self.changed = True
+        return None
+
+    def set(self, pid, pane_pid, pane_id):
+        # Moved to the end, the most recently used entries are kept.
+        self.entries.pop(str(pid), None)
+        self.entries[str(pid)] = [start_time(pid), pane_pid, pane_id]
+        self.changed = True
+
+    def _is_valid(self, pid, entry, panes):
+        process_start, pane_pid, pane_id = entry
+        return panes.get(pane_pid) == pane_id and start_time(pid) == process_start
+
+    def save(self, panes):
+        """Evict the invalid entries and the oldest ones above
+        MAX_CACHE_ENTRIES, and write the cache."""
+        entries = {
+            pid: entry
+            for pid, entry in list(self.entries.items())[-MAX_CACHE_ENTRIES:]
+            if self._is_valid(int(pid), entry, panes)
+        }
+        with tempfile.NamedTemporaryFile(
+            "w",
+            dir=os.path.dirname(self.path),
+            prefix=os.path.basename(self.path),
+            delete=False,
+        ) as f:
+            json.dump(entries, f)
+        os.replace(f.name, self.path)
+
+
+class OpenFileIndex:
+    """Snapshot of the paths used by the given processes: their open files and
+    current directory, read from /proc/<pid>/fd and /proc/<pid>/cwd in one
+    pass instead of running lsof over all processes.
+    """
+
+    def __init__(self, pids):
+        self.pids = {}
+        for pid in pids:
+            for path in self._read_paths(os.path.join(PROC_DIR, str(pid))):
+                self.pids.setdefault(path, set()).add(pid)
+
+    @staticmethod
+    def _read_paths(proc_dir):
+        try:
+            # Processes of other users (e.g. sudo) can't be read.
+            yield os.readlink(os.path.join(proc_dir, "cwd"))
+            fd_dir = os.path.join(proc_dir, "fd")
+            fds = os.listdir(fd_dir)
+        except OSError:
+            return
+        for fd in fds:
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                # Closed after listdir.
+                continue
+            # Skip e.g. "pipe:[1234]", "socket:[1234]" or "anon_inode:[...]".
+            if target.startswith("/"):
+                yield target
+
+    def find(self, path):
+        """Return the pids using path, or anything below it if it's a
+        directory."""
+        path = os.path.realpath(path)
+        prefix = path.rstrip("/") + "/"
+        pids = set()
+        for used, users in self.pids.items():
+            if used == path or used.startswith(prefix):
+                pids |= users
+        return pids
+
+
+class Snapshot:
+    """Lazily populated view of tmux panes and running processes.
+
+    Each part is queried on first use only, so every mode pays just for the
+    data it needs.
+    """
+
+    def __init__(self, tmux, cmd_timeout, cache=None):
+        self.tmux = tmux
         self.cmd_timeout = cmd_timeout
-        self.pids = set(int(line.strip()) for line in proc.stdout.splitlines())
+        self.cache = cache
+        self._panes = None
+        self._marked_pane = None
+        self._activity = None
+        self._proctable = None
+
+    def _list_panes(self):
+        output = self.tmux.command(
+            "list-panes",
+            "-a",
+            "-F",
+            "#{pane_pid}:#{pane_id}:#{pane_marked}:#{window_activity}",
+        )
+        self._panes = {}
+        self._marked_pane = ""
+        self._activity = {}
+        for line in output:
+            pid, pane_id, marked, activity = line.split(":")
+            self._panes[int(pid)] = pane_id
+            self._activity[pane_id] = int(activity or 0)
+            if marked == "1":
+                assert self._marked_pane == ""
+                self._marked_pane = pane_id
+
+    @property
+    def panes(self):
+        """pane_pid -> pane_id for all panes."""
+        if self._panes is None:
+            self._list_panes()
+        return self._panes
+
+    @property
+    def marked_pane(self):
+        if self._marked_pane is None:
+            self._list_panes()
+        return self._marked_pane
+
+    @property
+    def activity(self):
+        """pane_id -> last activity time of the pane's window."""
+        if self._activity is None:
+            self._list_panes()
+        return self._activity
+
+    @property
+    def proctable(self):
+        if self._proctable is None:
+            self._proctable = ProcessTable(self.cmd_timeout)
+        return self._proctable
 
     def exists(self, pid: int):
-        return pid in self.pids
+        if self._proctable is None and self.cache:
+            # Don't read the whole process table for a cache hit.
+            return start_time(pid) is not None
+        return pid in self.proctable.ppids
+
+    def get_tmux_pane(self, pid):
+        """Return the pane id owning the child process pid by walking up
+        its parent processes, or from the cache."""
+        if self.cache:
+            pane_id = self.cache.get(pid, self.panes)
+            if pane_id:
+                return pane_id
+        for ancestor in self.proctable.ancestors(pid):
+            if ancestor in self.panes:
+                if self.cache:
+                    self.cache.set(pid, ancestor, self.panes[ancestor])
+                return self.panes[ancestor]
+        raise RuntimeError("given pid doesn't belong to tmux server")
+
+    def find_panes_using(self, path):
+        """Return the ids of the panes whose processes use path, most recently
+        active window first.
+
+        Only the processes running in panes are looked at, their panes are
+        found with one walk over the process table.
+        """
+        if not os.path.isdir(os.path.join(PROC_DIR, "self")):
+            raise RuntimeError("--path requires %s" % PROC_DIR)
+        pane_of = {}
+        for pid in self.proctable.ppids:
+            chain = []
+            for ancestor in self.proctable.ancestors(pid):
+                if ancestor in pane_of:
+                    pane_id = pane_of[ancestor]
+                    break
+                chain.append(ancestor)
+                if ancestor in self.panes:
+                    pane_id = self.panes[ancestor]
+                    break
+            else:
+                pane_id = None
+            for ancestor in chain:
+                pane_of[ancestor] = pane_id
+        index = OpenFileIndex(pid for pid, pane_id in pane_of.items() if pane_id)
+        pane_ids = {pane_of[pid] for pid in index.find(path)}
+        return sorted(pane_ids, key=lambda pane_id: -self.activity[pane_id])
 
     def find_pid_in_pane(self, pane_id):
-        proc = subprocess.run(
-            ["tmux", "capture-pane", "-p", "-t", pane_id],
-            check=True,
-            universal_newlines=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=self.cmd_timeout,
+        output = self.tmux.command("capture-pane", "-p", "-t", pane_id)
+        return self._find_pid(output)[0]
+
+    def find_pid_in_panes(self, scrollback):
+        """Return the newest pid of a running process printed in any pane,
+        searching the visible lines and up to scrollback history lines.
+
+        All panes are captured in one batch of commands. The newest match is
+        the one in the most recently active window, and then the one closest
+        to the bottom of its pane.
+        """
+        pane_ids = list(self.activity)
+        replies = self.tmux.pipeline(
+            ("capture-pane", "-p", "-t", pane_id, "-S", str(-scrollback))
+            for pane_id in pane_ids
         )
-        for line in reversed(proc.stdout.splitlines()):
-            match = re.search(r"(?:process (?:id)|pid).{1,3}?(\b\d{2,}\b)", line, re.I)
-            if match and int(match.group(1)) in self.pids:
+        newest = None
+        for pane_id, reply in zip(pane_ids, replies):
+            if reply.error:
+                # The pane was closed after list-panes.
+                continue
+            pid, age = self._find_pid(reply.output)
+            if pid and (newest is None or (self.activity[pane_id], -age) > newest[0]):
+                newest = (self.activity[pane_id], -age), pid
+        return newest and newest[1]
+
+    def _find_pid(self, lines):
+        """Return the last pid of a running process in lines and the number
+        of (non-empty) lines after it, or (None, None)."""
+        age = 0
+        for line in reversed(lines):
+            if not line and not age:
+                # Empty lines below the output.
+                continue
+            match = PID_RE.search(line)
+            if match and self.exists(int(match.group(1))):
                 if DEBUG:
                     print(
                         "found %r in line: %r" % (match.group(1), line), file=sys.stderr
                     )
-                return int(match.group(1))
+                return int(match.group(1)), age
+            age += 1
+        return None, None
 
 
 def main():
@@ -126,45 +407,95 @@ def main():
         help="Mark the pane stored in buffer {}".format(BUFFER_NAME),
     )
     group.add_argument("--find-pid", metavar="pane_id")
+    group.add_argument(
+        "--find-pid-all",
+        action="store_true",
+        help="Find the newest pid printed in any pane",
+    )
     group.add_argument("--pid", type=int)
+    group.add_argument(
+        "--path",
+        help="Find the panes using this file or directory, the most recently "
+        "active one is the target",
+    )
+    parser.add_argument(
+        "--scrollback",
+        type=int,
+        default=200,
+        metavar="LINES",
+        help="History lines searched per pane by --find-pid-all (default: "
+        "%(default)s)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="Don't use the cache of the panes of earlier looked up pids",
+    )
     parser.add_argument("-q", "--quiet", dest="verbose", action="store_false")
     args = parser.parse_args()
     if "TMUX" not in os.environ:
         raise RuntimeError("must run in tmux client")
-    panes = Panes(args.timeout)
-    pids = Pids(args.timeout)
+    with ControlClient(args.timeout) as tmux:
+        run(args, tmux)
+
+
+def run(args, tmux):
+    cache = PaneCache.for_server() if args.cache else None
+    snapshot = Snapshot(tmux, args.timeout, cache)
+    _run(args, tmux, snapshot)
+    if cache and cache.changed:
+        try:
+            cache.save(snapshot.panes)
+        except OSError as e:
+            if DEBUG:
+                print("saving the cache failed: %s" % e, file=sys.stderr)
+
+
+def _run(args, tmux, snapshot):
     if args.mark_buffer_pane:
-        p = subprocess.run(
-            ["tmux", "show-buffer", "-b", BUFFER_NAME],
-            check=True,
-            timeout=1,
-            stdout=subprocess.PIPE,
-            universal_newlines=True,
-        )
-        pane_id = p.stdout.strip()
+        pane_id = "\n".join(tmux.command("show-buffer", "-b", BUFFER_NAME)).strip()
         if args.verbose:
             print(pane_id)
-        if pane_id != panes.marked_pane:
+        if pane_id != snapshot.marked_pane:
             # Make sure the pane just loaded from BUFFER_NAME is marked.
-            subprocess.run(
-                ["tmux", "select-pane", "-m", "-t", pane_id], check=True, timeout=1
+            select, _ = tmux.pipeline(
+                [
+                    ("select-pane", "-m", "-t", pane_id),
+                    ("delete-buffer", "-b", BUFFER_NAME),
+                ]
             )
-        subprocess.run(["tmux", "delete-buffer", "-b", BUFFER_NAME], timeout=1)
+            if select.error:
+                raise TmuxError("select-pane: %s" % "\n".join(select.output))
+        else:
+            tmux.pipeline([("delete-buffer", "-b", BUFFER_NAME)])
         return
-    if args.find_pid:
-        pid = pids.find_pid_in_pane(args.find_pid)
+    if args.find_pid or args.find_pid_all:
+        if args.find_pid:
+            pid = snapshot.find_pid_in_pane(args.find_pid)
+        else:
+            pid = snapshot.find_pid_in_panes(args.scrollback)
         if pid:
-            pane_id = panes.get_tmux_pane(pid)
+            pane_id = snapshot.get_tmux_pane(pid)
             if args.verbose:
                 print(pane_id)
         else:
             if args.verbose:
                 print("No pid found in pane")
             return
+    if args.path:
+        pane_ids = snapshot.find_panes_using(args.path)
+        if not pane_ids:
+            if args.verbose:
+                print("No pane uses %s" % args.path)
+            return
+        if args.verbose:
+            print("\n".join(pane_ids))
+        pane_id = pane_ids[0]
     if args.pid:
-        if not pids.exists(args.pid):
+        if not snapshot.exists(args.pid):
             raise RuntimeError("no such process: %s" % args.pid)
-        pane_id = panes.get_tmux_pane(args.pid)
+        pane_id = snapshot.get_tmux_pane(args.pid)
         if args.verbose:
             print(pane_id)
     assert pane_id
@@ -173,24 +504,10 @@ def main():
         # to find our way back, by calling this script again with
         # `--mark-buffer-pane`, which will set the stored pane to the marked pane,
         # to ease navigating back again.
-        subprocess.run(
-            [
-                "tmux",
-                "load-buffer",
-                "-b",
-                BUFFER_NAME,
-                "-",
-            ],
-            check=True,
-            timeout=1,
-            universal_newlines=True,
-            input=args.mark_pane,
-        )
-        if pane_id != panes.marked_pane:
+        tmux.command("set-buffer", "-b", BUFFER_NAME, args.mark_pane)
+        if pane_id != snapshot.marked_pane:
             # Make sure target pane is marked so that tmux can switchc to it.
-            subprocess.run(
-                ["tmux", "select-pane", "-m", "-t", pane_id], check=True, timeout=1
-            )
+            tmux.command("select-pane", "-m", "-t", pane_id)
 
 
 if __name__ == "__main__":
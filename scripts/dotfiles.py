@@ -1,19 +1,54 @@
 #!/usr/bin/env python3
 """
 Find custom shell functions and print their name and description.
+
+The functions found in each file are cached in $XDG_CACHE_HOME/dotfiles, a
+file is only parsed again when its mtime or size changed.
+
+With --interactive, patterns are read one per line from stdin and each is
+answered with the ranked matches, as "name<TAB>first description line"
+lines followed by an empty line:
+    printf 'fzf\ngit\n' | dotfiles.py --interactive
+
+With --serve, the same queries are answered on a Unix socket, from functions
+kept parsed in memory while their files are watched for changes. Shell
+completions and fzf then skip starting Python:
+    dotfiles.py --serve &
+    fzf --disabled --bind "change:reload(echo {q} | socat - \\
+        UNIX-CONNECT:$XDG_RUNTIME_DIR/dotfiles.sock)"
 """
 import argparse
+import collections
+import json
 import logging as log
+import os
 import pathlib
 import itertools
+import sys
+import tempfile
 import textwrap
+import time
 import re
+import signal
+
+# Only --serve needs these, they are imported by serve() so that a search
+# starts without them.
+asyncio = _inotify = None
 
 BASHRC = pathlib.Path("~/.bashrc").expanduser()
 BASH_DIRS = (
     pathlib.Path("~/.bashrc.d").expanduser(),
     pathlib.Path(__file__).parent.parent / "bash",
 )
+FUNCTION_RE = re.compile(r"(?:(\w+)\(\)|# dotfiles-help: (.+))")
+CACHE_VERSION = 1
+# Files modified this recently may change again within the same mtime, they
+# are parsed again until they're older.
+CACHE_MIN_AGE_NS = 2 * 10 ** 9
+# Seconds to wait for more changes before parsing changed files.
+RELOAD_DELAY = 0.1
+# Characters with a special meaning in a pattern, see required_literals().
+PATTERN_SPECIAL = set(".^$*+?{}[]\\|()")
 
 
 def main():
@@ -27,6 +62,18 @@ def main():
     parser.add_argument(
         "-v", "--verbose", "--where", action="store_true", dest="verbose",
         help="Print filename where function is defined")
+    parser.add_argument(
+        "--no-cache", action="store_false", dest="cache",
+        help="Parse all files instead of using the cache")
+    parser.add_argument(
+        "-i", "--interactive", action="store_true",
+        help="Answer patterns read from stdin, see above")
+    parser.add_argument(
+        "--serve", action="store_true",
+        help="Answer patterns on --socket, see above")
+    parser.add_argument(
+        "--socket", type=pathlib.Path,
+        help="Socket of --serve (default: $XDG_RUNTIME_DIR/dotfiles.sock)")
     parser.add_argument(
         "pattern",
         nargs="?",
@@ -40,13 +87,26 @@ def main():
         if args.log_level == "DEBUG"
         else "%(asctime)s %(levelname)-8s %(message)s",
     )
-    functions = {}
-    for f in itertools.chain(
-        (BASHRC,),
-        itertools.chain.from_iterable(path.glob("*.bash") for path in BASH_DIRS),
-    ):
-        log.info("Processing %s", f)
-        functions.update({name: (desc, path) for name, desc, path in get_functions(f)})
+    cache_file = None
+    if args.cache:
+        # $XDG_CACHE_HOME as pyxdg would find it, without importing it.
+        cache_home = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+        cache_file = pathlib.Path(cache_home, "dotfiles", "index.json")
+
+    if args.serve:
+        socket = args.socket
+        if socket is None:
+            if not os.environ.get("XDG_RUNTIME_DIR"):
+                parser.error("--serve needs --socket when $XDG_RUNTIME_DIR isn't set")
+            socket = pathlib.Path(os.environ["XDG_RUNTIME_DIR"], "dotfiles.sock")
+        serve(cache_file, socket)
+        return
+
+    functions = load_functions(bash_files(), cache_file)
+
+    if args.interactive:
+        interactive(SearchIndex(functions), sys.stdin, sys.stdout)
+        return
 
     regex = re.compile(args.pattern, flags=re.I) if args.pattern else None
     for name in sorted(functions):
@@ -63,15 +123,359 @@ def main():
             log.info("Not printing %s", name)
 
 
+def interactive(index, queries, out):
+    for line in queries:
+        out.write(answer(index, line.rstrip("\n")))
+        out.flush()
+
+
+def answer(index, pattern):
+    """Ranked "name<TAB>summary" lines of the matches, and an empty line."""
+    try:
+        names = index.search(pattern)
+    except re.error as e:
+        log.info("Invalid pattern %r: %s", pattern, e)
+        names = []
+    lines = ("{}\t{}\n".format(name, index.summary(name)) for name in names)
+    return "".join(lines) + "\n"
+
+
+def serve(cache_file, path):
+    global asyncio, _inotify
+    import asyncio
+
+    import _inotify
+
+    asyncio.run(Server(cache_file).run(path))
+
+
+class Server:
+    """Keep the functions of the bash files parsed and answer --interactive
+    queries on a Unix socket. The bash files' directories, and those of the
+    files they link to, are watched with inotify, and changed files parsed
+    again."""
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.entries = read_cache(cache_file) if cache_file else {}
+        self.index = None
+        self.inotify = None
+        # Resolved paths of the bash files, setup links them to the dotfiles
+        # checkout and writing a link's target doesn't notify its directory.
+        self.targets = set()
+        self._reload_handle = None
+        self.reload()
+
+    def reload(self):
+        self._reload_handle = None
+        files = list(bash_files())
+        self.targets = {path.resolve() for path in files}
+        if self.inotify:
+            self._watch({path.parent for path in self.targets})
+        entries = scan_files(files, self.entries)
+        if self.cache_file and entries != self.entries:
+            write_cache(self.cache_file, entries)
+        if self.index is None or entries != self.entries:
+            self.index = SearchIndex(functions_from(entries))
+            log.info("Indexed %d functions", len(self.index.names))
+        self.entries = entries
+
+    async def run(self, path):
+        server = await self._listen(path)
+        if not server:
+            log.warning("Already serving on %s", path)
+            return
+        log.info("Serving on %s", path)
+        # A new server may bind path once this one stopped listening, its
+        # socket must not be removed.
+        inode = path.stat().st_ino
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        with _inotify.Inotify() as self.inotify:
+            self._watch({BASHRC.parent, *BASH_DIRS})
+            self._watch({path.parent for path in self.targets})
+            loop.add_reader(self.inotify.fileno(), self._read_events)
+            try:
+                async with server:
+                    await stop.wait()
+            finally:
+                loop.remove_reader(self.inotify.fileno())
+                try:
+                    if path.stat().st_ino == inode:
+                        path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _watch(self, directories):
+        events = (
+            _inotify.IN_CLOSE_WRITE
+            | _inotify.IN_CREATE
+            | _inotify.IN_DELETE
+            | _inotify.IN_MOVED_FROM
+            | _inotify.IN_MOVED_TO
+        )
+        for directory in directories - set(self.inotify.watches.values()):
+            try:
+                self.inotify.add_watch(directory, events)
+            except OSError as e:
+                log.warning("Not watching %s: %s", directory, e)
+
+    async def _listen(self, path):
+        """Return a server listening at path, or None if another server is
+        already listening there."""
+        if path.exists():
+            try:
+                reader, writer = await asyncio.open_unix_connection(str(path))
+            except (FileNotFoundError, ConnectionRefusedError):
+                log.info("Removing stale socket %s", path)
+                path.unlink(missing_ok=True)
+            else:
+                writer.close()
+                return None
+        return await asyncio.start_unix_server(self._handle_connection, str(path))
+
+    def _read_events(self):
+        for event in self.inotify.read():
+            directory = self.inotify.watches.get(event.wd)
+            path = directory and directory / event.name
+            if (
+                event.mask & _inotify.IN_Q_OVERFLOW
+                or path in self.targets
+                or directory in BASH_DIRS
+                and event.name.endswith(".bash")
+                or path == BASHRC
+            ):
+                log.debug("%s %s: %#x", directory, event.name, event.mask)
+                # Editors write a file in several steps, parse it once.
+                if self._reload_handle:
+                    self._reload_handle.cancel()
+                self._reload_handle = asyncio.get_running_loop().call_later(
+                    RELOAD_DELAY, self.reload
+                )
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                writer.write(answer(self.index, line.decode().rstrip("\n")).encode())
+                await writer.drain()
+        except (OSError, UnicodeDecodeError) as e:
+            log.warning("Bad request: %s", e)
+        finally:
+            writer.close()
+
+
+class SearchIndex:
+    """Trigram postings of the lowercased names and descriptions of functions,
+    which narrow down the functions a pattern has to be matched against.
+
+    Consecutive searches where each pattern is the previous one extended, as
+    typed in a search box, only match among the previous results.
+    """
+
+    def __init__(self, functions):
+        self.names = sorted(functions)
+        self.descriptions = ["\n".join(functions[name][0]) for name in self.names]
+        self.postings = collections.defaultdict(set)
+        for i, (name, desc) in enumerate(zip(self.names, self.descriptions)):
+            for text in (name, desc):
+                for trigram in trigrams(text.lower()):
+                    self.postings[trigram].add(i)
+        self._summaries = {
+            name: desc.partition("\n")[0]
+            for name, desc in zip(self.names, self.descriptions)
+        }
+        # Literal pattern and matches of the last search.
+        self._last = (None, None)
+
+    def summary(self, name):
+        return self._summaries[name]
+
+    def search(self, pattern):
+        """Return the names of functions matching pattern in name or
+        description, best match first. An empty pattern returns all but the
+        private (_name) functions."""
+        if not pattern:
+            return [name for name in self.names if not name.startswith("_")]
+        regex = re.compile(pattern, flags=re.I)
+        literals = required_literals(pattern)
+        last_pattern, last_matches = self._last
+        if last_pattern and literals == [pattern] and pattern.startswith(last_pattern):
+            candidates = last_matches
+        else:
+            candidates = self.candidates(literals)
+        matches = [
+            i
+            for i in candidates
+            if regex.search(self.names[i]) or regex.search(self.descriptions[i])
+        ]
+        self._last = (pattern if literals == [pattern] else None, matches)
+        return sorted(
+            (self.names[i] for i in matches), key=lambda name: rank(name, regex)
+        )
+
+    def candidates(self, literals):
+        """Return the ids of functions containing all trigrams of literals."""
+        candidates = None
+        for literal in literals or ():
+            for trigram in trigrams(literal.lower()):
+                posting = self.postings.get(trigram, set())
+                candidates = posting if candidates is None else candidates & posting
+                if not candidates:
+                    return []
+        return range(len(self.names)) if candidates is None else sorted(candidates)
+
+
+def trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def required_literals(pattern):
+    """Return substrings that any match of pattern contains, or None if that
+    isn't simple to tell (alternation or groups).
+
+    Only ASCII literals are returned, as case insensitive matching of other
+    characters isn't the same as comparing them lowercased."""
+    if any(c in pattern for c in "|()"):
+        return None
+    literals = []
+    run = ""
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c not in PATTERN_SPECIAL:
+            run += c
+        elif c == "\\" and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            i += 1
+            run += pattern[i]
+        else:
+            if c in "?*{":
+                # The previous character is optional.
+                run = run[:-1]
+            literals.append(run)
+            run = ""
+            if c == "\\":
+                i += 1
+            elif c == "[":
+                # Skip the class, a ] right after [ or [^ is a member.
+                i = pattern.find("]", i + (3 if pattern[i + 1 : i + 2] == "^" else 2))
+            elif c == "{":
+                i = pattern.find("}", i)
+            if i < 0:
+                return None
+        i += 1
+    literals.append(run)
+    return [literal for literal in literals if literal and literal.isascii()]
+
+
+def rank(name, regex):
+    """Sort key of a match, public functions first, each by whole name
+    matches, name prefixes, other name matches and description matches."""
+    match = regex.search(name)
+    if not match:
+        order = 3
+    elif match.start() == 0:
+        order = 0 if match.end() == len(name) else 1
+    else:
+        order = 2
+    return name.startswith("_"), order, len(name), name
+
+
+def bash_files():
+    return itertools.chain(
+        (BASHRC,),
+        itertools.chain.from_iterable(path.glob("*.bash") for path in BASH_DIRS),
+    )
+
+
+def load_functions(files, cache_file=None):
+    """Return {name: (description lines, path)} of the functions in files.
+    Only the files that changed since they were cached in cache_file are
+    parsed."""
+    cache = read_cache(cache_file) if cache_file else {}
+    entries = scan_files(files, cache)
+    if cache_file and entries != cache:
+        write_cache(cache_file, entries)
+    return functions_from(entries)
+
+
+def scan_files(files, cache):
+    """Return the cache entries of files, parsing the files that aren't in
+    cache or changed since."""
+    entries = {}
+    now = time.time_ns()
+    for f in files:
+        try:
+            stat = f.stat()
+        except FileNotFoundError:
+            log.warning("%s not found", f)
+            continue
+        key = str(f)
+        entry = cache.get(key)
+        if (
+            entry is None
+            or entry["mtime_ns"] != stat.st_mtime_ns
+            or entry["size"] != stat.st_size
+        ):
+            log.info("Processing %s", f)
+            entry = {
+                "mtime_ns": stat.st_mtime_ns
+                if now - stat.st_mtime_ns > CACHE_MIN_AGE_NS
+                else None,
+                "size": stat.st_size,
+                "functions": [[name, desc] for name, desc, _ in get_functions(f)],
+            }
+        entries[key] = entry
+    return entries
+
+
+def functions_from(entries):
+    functions = {}
+    for path, entry in entries.items():
+        path = pathlib.Path(path)
+        functions.update({name: (desc, path) for name, desc in entry["functions"]})
+    return functions
+
+
+def read_cache(cache_file):
+    try:
+        with cache_file.open() as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        log.info("Not using cache %s: %s", cache_file, e)
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache["files"]
+
+
+def write_cache(cache_file, entries):
+    """Replace cache_file atomically, concurrent runs read either version.
+    Failing to write it only loses the cache."""
+    f = None
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cache_file.parent, prefix=cache_file.name, delete=False
+        ) as f:
+            json.dump({"version": CACHE_VERSION, "files": entries}, f)
+        os.replace(f.name, cache_file)
+    except OSError as e:
+        log.info("Not writing cache %s: %s", cache_file, e)
+        if f is not None:
+            pathlib.Path(f.name).unlink(missing_ok=True)
+
+
 def get_functions(bashfile):
     comment = []
     with bashfile.open() as f:
         for line in f:
-            if (match := re.match(r"(?:(\w+)\(\)|# dotfiles-help: (.+))", line)) :
+            if (match := FUNCTION_RE.match(line)) :
                 log.debug("Function: %s", match[1])
                 yield match[1] or match[2], comment, bashfile
                 comment = []
-            if re.match(r"# ", line):
+            if line.startswith("# "):
                 comment.append(line[2:].strip())
                 log.debug("Comment: %s", line)
             else:
@@ -3,12 +3,267 @@ r"""
 Convert JSON on stdin to YAML on stdout (or --reverse).
 
 Example: json_to_yaml.py < input.json > output.yaml
+
+With --stream, JSON Lines or other concatenated JSON documents are converted to
+multi-document YAML one document at a time (and back with --reverse), so the
+whole input is never in memory:
+    kubectl get events -w -o json | json_to_yaml.py --stream
+
+Convert many files at once on all cores, skipping those already converted:
+    json_to_yaml.py -r -o json/ 'manifests/**/*.yaml'
+
+YAML is loaded and dumped with LibYAML when PyYAML was built with it, see
+--backend.
 """
 import argparse
+import functools
 import json
+import os
+import re
 import sys
 
-import yaml
+# PyYAML and its fastest safe loader and dumper, set by import_yaml(). Only
+# the paths converting YAML import it, --pretty starts without it. Likewise,
+# the modules only used by the batch mode are imported there.
+yaml = SafeLoader = SafeDumper = None
+
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Skipped when counting brackets, a JSON string doesn't span lines.
+JSON_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+# For the permissions of converted files, which are written as temporary files.
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def import_yaml():
+    global yaml, SafeLoader, SafeDumper
+    if yaml is not None:
+        return
+    import yaml
+
+    try:
+        # An order of magnitude faster, see dump_yaml() for the output.
+        from yaml import CSafeDumper as SafeDumper
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeDumper, SafeLoader
+
+
+def iter_json(stream):
+    """Yield each of the concatenated JSON documents in stream (like JSON
+    Lines) as soon as it is complete, raise ValueError for invalid JSON."""
+    decoder = json.JSONDecoder()
+    lines = []
+    depth = 0
+    for line in stream:
+        if not lines:
+            # A line holding one document, JSON Lines, parsed without counting
+            # its brackets.
+            try:
+                data, end = decoder.raw_decode(line, JSON_WHITESPACE.match(line).end())
+            except ValueError:
+                pass
+            else:
+                if JSON_WHITESPACE.match(line, end).end() == len(line):
+                    yield data
+                    continue
+        lines.append(line)
+        if '"' in line:
+            line = JSON_STRING.sub("", line)
+        depth += line.count("[") + line.count("{") - line.count("]") - line.count("}")
+        # Documents are only parsed once all brackets are closed, then the
+        # lines hold complete documents or invalid JSON.
+        if depth <= 0:
+            yield from _decode_all(decoder, "".join(lines))
+            lines.clear()
+            depth = 0
+    yield from _decode_all(decoder, "".join(lines))
+
+
+def _decode_all(decoder, text):
+    pos = JSON_WHITESPACE.match(text).end()
+    while pos < len(text):
+        data, pos = decoder.raw_decode(text, pos)
+        yield data
+        pos = JSON_WHITESPACE.match(text, pos).end()
+
+
+def dump_yaml(data, stream, **kwargs):
+    """yaml.safe_dump(), with LibYAML when it gives the same output."""
+    import_yaml()
+    dumper = SafeDumper if _libyaml_dumps_alike(data) else yaml.SafeDumper
+    yaml.dump(data, stream=stream, Dumper=dumper, **kwargs)
+
+
+def _libyaml_dumps_alike(data):
+    """LibYAML folds long double-quoted strings at other places than the pure
+    Python dumper, look for strings that may be double-quoted: with
+    non-ASCII or non-printable characters, or a space next to a line break.
+    An empty key, a long key (written as an explicit "? key" by the pure
+    Python dumper from 123 characters, by LibYAML from 129) and the end of a
+    scalar document are written differently too."""
+    if not isinstance(data, (dict, list)):
+        return False
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            if (
+                not (item.isascii() and item.replace("\n", "").isprintable())
+                or " \n" in item
+                or "\n " in item
+            ):
+                return False
+        elif isinstance(item, dict):
+            if "" in item or max(map(len, item), default=0) > 120:
+                return False
+            stack.extend(item)
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return True
+
+
+def yaml_backend():
+    """Describe the YAML loader and dumper in use."""
+    import_yaml()
+    backend = "LibYAML" if SafeLoader.__name__.startswith("C") else "pure Python"
+    return "PyYAML %s, %s (%s, %s)" % (
+        yaml.__version__,
+        backend,
+        SafeLoader.__name__,
+        SafeDumper.__name__,
+    )
+
+
+def convert(args, src, dst):
+    """Convert src to dst as selected by args, raise ValueError for invalid
+    input."""
+    if args.pretty and not args.reverse:
+        _convert(args, src, dst)
+        return
+    import_yaml()
+    try:
+        _convert(args, src, dst)
+    except yaml.YAMLError as e:
+        raise ValueError(e) from e
+    except TypeError as e:
+        # YAML that has no JSON equivalent, e.g. an unquoted timestamp.
+        raise ValueError(e) from e
+
+
+def _convert(args, src, dst):
+    if args.stream:
+        if args.reverse:
+            documents = yaml.load_all(src, Loader=SafeLoader)
+        else:
+            documents = iter_json(src)
+        for data in documents:
+            if args.reverse or args.pretty:
+                json.dump(data, dst, indent=4)
+                dst.write("\n")
+            else:
+                dump_yaml(data, dst, explicit_start=True)
+            dst.flush()
+        return
+
+    if args.reverse:
+        data = yaml.load(src, Loader=SafeLoader)
+    else:
+        data = json.load(src)
+    if args.reverse or args.pretty:
+        json.dump(data, dst, indent=4)
+    else:
+        dump_yaml(data, dst)
+
+
+def convert_files(args, patterns):
+    """Convert the files matching patterns into args.output_dir over a pool of
+    args.jobs processes, return the number of failed files. Nothing is
+    converted if two files would be converted to the same output."""
+    import glob
+    import multiprocessing
+
+    suffix = ".json" if args.reverse or args.pretty else ".yaml"
+    tasks = []
+    failures = 0
+    collisions = 0
+    inputs = {}
+    for pattern in patterns:
+        filenames = sorted(glob.glob(pattern, recursive=True))
+        if not filenames:
+            print("%s: No such file" % pattern, file=sys.stderr)
+            failures += 1
+        for filename in filenames:
+            output = os.path.normpath(output_path(filename, args.output_dir, suffix))
+            if output in inputs:
+                # Absolute and ../ paths are converted to their basename.
+                other = inputs[output]
+                if os.path.realpath(other) != os.path.realpath(filename):
+                    print(
+                        "%s: Same output %s as %s" % (filename, output, other),
+                        file=sys.stderr,
+                    )
+                    collisions += 1
+                continue
+            inputs[output] = filename
+            if args.force or not is_up_to_date(output, filename):
+                tasks.append((filename, output))
+    if collisions:
+        return failures + collisions
+    convert_file = functools.partial(_convert_file, args)
+    if args.jobs == 1 or len(tasks) < 2:
+        return failures + _report_errors(map(convert_file, tasks))
+    with multiprocessing.Pool(min(args.jobs or os.cpu_count(), len(tasks))) as pool:
+        return failures + _report_errors(pool.imap_unordered(convert_file, tasks))
+
+
+def _report_errors(results):
+    failures = 0
+    for filename, error in results:
+        if error:
+            print("%s: %s" % (filename, error), file=sys.stderr)
+            failures += 1
+    return failures
+
+
+def output_path(filename, output_dir, suffix):
+    """filename in output_dir with suffix, relative paths keep their
+    directories."""
+    if os.path.isabs(filename) or filename.split(os.sep)[0] == os.pardir:
+        filename = os.path.basename(filename)
+    return os.path.join(output_dir, os.path.splitext(filename)[0] + suffix)
+
+
+def is_up_to_date(output, filename):
+    try:
+        return os.stat(output).st_mtime_ns >= os.stat(filename).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def _convert_file(args, task):
+    """Convert filename to output, replaced atomically. Return filename and an
+    error message or None."""
+    import tempfile
+
+    filename, output = task
+    directory = os.path.dirname(output) or "."
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(filename) as src, tempfile.NamedTemporaryFile(
+            "w", dir=directory, prefix=".%s." % os.path.basename(output), delete=False
+        ) as dst:
+            try:
+                convert(args, src, dst)
+                os.chmod(dst.name, 0o666 & ~UMASK)
+            except BaseException:
+                os.unlink(dst.name)
+                raise
+        os.replace(dst.name, output)
+    except (OSError, ValueError) as e:
+        return filename, str(e)
+    return filename, None
 
 
 def main():
@@ -21,26 +276,59 @@ def main():
     parser.add_argument(
         "--pretty", "--format", action="store_true", help="Just pretty-print JSON"
     )
+    parser.add_argument(
+        "--stream",
+        "-s",
+        action="store_true",
+        help="Convert each document of concatenated JSON (or multi-document YAML "
+        "with --reverse) as it is read",
+    )
+    parser.add_argument(
+        "--backend",
+        action="store_true",
+        help="Print whether YAML is handled by LibYAML or pure Python and exit",
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="Files or glob patterns (** matches directories recursively) to "
+        "convert into --output-dir instead of stdin",
+    )
+    parser.add_argument(
+        "--output-dir",
+        "-o",
+        metavar="DIR",
+        help="Write the converted files here, as .yaml (or .json with --reverse "
+        "and --pretty). Files older than their output are skipped.",
+    )
+    parser.add_argument(
+        "--force", "-f", action="store_true", help="Convert up to date files too"
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        metavar="N",
+        default=0,
+        help="Convert files on N processes, default all cores",
+    )
     args = parser.parse_args()
 
-    if args.reverse:
-        try:
-            data = yaml.safe_load(sys.stdin)
-        except yaml.scanner.ScannerError as e:
-            parser.error("Failed to decode stdin as YAML: %s" % e)
-        else:
-            json.dump(data, sys.stdout, indent=4)
+    if args.backend:
+        print(yaml_backend())
         return
 
+    if args.files or args.output_dir:
+        if not (args.files and args.output_dir):
+            parser.error("files and --output-dir must be given together")
+        sys.exit(1 if convert_files(args, args.files) else 0)
+
     try:
-        data = json.load(sys.stdin)
+        convert(args, sys.stdin, sys.stdout)
     except ValueError as e:
-        parser.error("Failed to decode stdin as JSON: %s" % e)
-    else:
-        if args.pretty:
-            json.dump(data, sys.stdout, indent=4)
-        else:
-            yaml.safe_dump(data, stream=sys.stdout)
+        parser.error(
+            "Failed to decode stdin as %s: %s" % ("YAML" if args.reverse else "JSON", e)
+        )
 
 
 if __name__ == "__main__":
@@ -11,22 +11,461 @@ Given a logfile with unix timestamps:
     done
 Watch it with: `tail -f /tmp/test.log | unix2iso.py` to convert timestamps to ISO timestamps.
 
+Convert back to POSIX timestamps with: `unix2iso.py --reverse`.
+
+Convert a large file with: `unix2iso.py --bulk big.log > big-iso.log`, or
+on all cores with `unix2iso.py --jobs 0 big.log > big-iso.log`.
+
+Print throughput and cache counters with `--stats`, at exit or on SIGUSR1:
+`kill -USR1 $(pgrep -f unix2iso.py)`.
+
 """
 
 import argparse
+import calendar
+import collections
+import cProfile
 import fileinput
 import functools
+import json
 import locale
 import logging as log
+import mmap
+import multiprocessing
+import os
 import re
+import signal
 import sys
 import time
 
+# Seconds, ms, µs or ns since epoch.
+TIMESTAMP_RE = re.compile(r"\b[123]\d{9}(?:\d{3}){0,3}\b")
+CACHE_SIZE = 4096
+BLOCK_SIZE = 1 << 20
+CHUNK_SIZE = 4 << 20
+
+# Converter of a --jobs worker process.
+_worker_converter = None
+
 
 class Unix2ISOException(Exception):
     """Program exceptions."""
 
 
+class TimestampCache(dict):
+    """Formatted output for a window of recently seen timestamps.
+
+    Timestamps in logs are mostly increasing, so when full the oldest entry
+    is evicted, like in a ring buffer. Unlike an LRU cache nothing is
+    reordered on hits.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        super().__init__()
+        self.size = size
+
+    def add(self, key, value):
+        if len(self) >= self.size:
+            del self[next(iter(self))]
+        self[key] = value
+
+
+class CountingCache(TimestampCache):
+    """TimestampCache counting hits and misses in counts, for --stats."""
+
+    def __init__(self, counts, size=CACHE_SIZE):
+        super().__init__(size)
+        self.counts = counts
+
+    def get(self, key):
+        value = super().get(key)
+        self.counts["cache hits" if value is not None else "cache misses"] += 1
+        return value
+
+
+class Stats:
+    """Throughput counters and timers of a converter, for --stats.
+
+    The converter's convert and replace callbacks are wrapped, so there is
+    no cost when stats aren't enabled. Time in the replace callback (cache
+    lookups and formatting) is reported apart from the rest of convert,
+    which is mostly the regex scan. The timers add some overhead to the
+    former.
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.convert_time = 0.0
+        self.replace_time = 0.0
+        self.started = time.perf_counter()
+
+    def cache(self):
+        return CountingCache(self.counts)
+
+    def instrument(self, converter):
+        name = "_replace_field" if getattr(converter, "fields", None) else "_replace"
+        replace = getattr(converter, name)
+        convert = converter.convert
+        counts = self.counts
+        perf_counter = time.perf_counter
+
+        def _replace(match):
+            start = perf_counter()
+            result = replace(match)
+            self.replace_time += perf_counter() - start
+            counts["matches"] += 1
+            if result != match[0]:
+                counts["conversions"] += 1
+            return result
+
+        def _convert(text):
+            counts["lines"] += text.count("\n")
+            counts["chars"] += len(text)
+            start = perf_counter()
+            result = convert(text)
+            self.convert_time += perf_counter() - start
+            return result
+
+        setattr(converter, name, _replace)
+        converter.convert = _convert
+
+    def report(self, file=sys.stderr):
+        elapsed = time.perf_counter() - self.started
+        counts = self.counts
+        lookups = counts["cache hits"] + counts["cache misses"]
+        lines = [
+            f"elapsed       {elapsed:12.3f}s",
+            f"lines         {counts['lines']:12d}  {counts['lines'] / elapsed:.0f}/s",
+            f"chars         {counts['chars']:12d}  "
+            f"{counts['chars'] / elapsed / 1e6:.1f}M/s",
+            f"matches       {counts['matches']:12d}",
+            f"conversions   {counts['conversions']:12d}",
+            f"cache hits    {counts['cache hits']:12d}  "
+            f"{counts['cache hits'] / (lookups or 1):.1%}",
+            f"cache misses  {counts['cache misses']:12d}",
+            f"regex time    {self.convert_time - self.replace_time:12.3f}s",
+            f"format time   {self.replace_time:12.3f}s",
+        ]
+        print("\n".join(lines), file=file, flush=True)
+
+
+class Converter:
+    """Replace timestamps within limit_past - limit_future in text.
+
+    Timestamps in seconds, milliseconds, microseconds and nanoseconds (10,
+    13, 16 or 19 digits) are matched in the same scan. %f in fmt is replaced
+    by the fraction of the second (with the dot) of the latter, and removed
+    for timestamps in seconds.
+
+    With fields, only the values of those keys in JSON ("ts": 1700000000)
+    or logfmt (ts=1700000000) are converted, to JSON strings and logfmt
+    values quoted as needed.
+    """
+
+    def __init__(
+        self,
+        limit_past,
+        limit_future,
+        fmt,
+        time_func,
+        pattern=TIMESTAMP_RE,
+        fields=None,
+        stats=None,
+    ):
+        self.limit_past = limit_past
+        self.limit_future = limit_future
+        self.fmt = fmt
+        self.time_func = time_func
+        self.pattern = pattern
+        self.fields = fields
+        self.cache = TimestampCache() if stats is None else stats.cache()
+        self.fraction_cache = TimestampCache() if stats is None else stats.cache()
+        self.format_timestamp = self._make_format()
+        if fields:
+            self.json_pattern, self.logfmt_pattern = field_patterns(fields)
+            self.convert = self._convert_fields
+        else:
+            format_timestamp = self.format_timestamp
+            self._replace = lambda match: format_timestamp(match[0])
+        if stats is not None:
+            stats.instrument(self)
+
+    def _make_format(self):
+        # Called for every match, so everything is bound to locals.
+        cache_get = self.cache.get
+        cache_add = self.cache.add
+        fraction_cache_get = self.fraction_cache.get
+        fraction_cache_add = self.fraction_cache.add
+        limit_past = self.limit_past
+        limit_future = self.limit_future
+        # The range check of each precision, by number of digits.
+        limits = {
+            10 + digits: (
+                int(limit_past * 10 ** digits),
+                int(limit_future * 10 ** digits),
+            )
+            for digits in (3, 6, 9)
+        }
+        strftime = time.strftime
+        seconds_fmt = self.fmt.replace("%f", "")
+        keep_fraction = "%f" in self.fmt
+        # strftime leaves "%f" in the output as a placeholder for the fraction.
+        fraction_fmt = self.fmt.replace("%f", "%%f")
+        time_func = self.time_func
+
+        def _format(timestamp):
+            if len(timestamp) == 10:
+                formatted = cache_get(timestamp)
+                if formatted is not None:
+                    return formatted
+                ts = int(timestamp)
+                if limit_past <= ts <= limit_future:
+                    formatted = strftime(seconds_fmt, time_func(ts))
+                    cache_add(timestamp, formatted)
+                    return formatted
+                return timestamp
+            low, high = limits[len(timestamp)]
+            if not low <= int(timestamp) <= high:
+                return timestamp
+            seconds = timestamp[:10]
+            if not keep_fraction:
+                formatted = cache_get(seconds)
+                if formatted is None:
+                    formatted = strftime(seconds_fmt, time_func(int(seconds)))
+                    cache_add(seconds, formatted)
+                return formatted
+            formatted = fraction_cache_get(seconds)
+            if formatted is None:
+                formatted = strftime(fraction_fmt, time_func(int(seconds)))
+                fraction_cache_add(seconds, formatted)
+            return formatted.replace("%f", "." + timestamp[10:])
+
+        return _format
+
+    def _convert_fields(self, text):
+        fields = self.fields
+        json_sub = functools.partial(self.json_pattern.sub, self._replace_field)
+        logfmt_sub = functools.partial(self.logfmt_pattern.sub, self._replace_field)
+        lines = []
+        for line in text.splitlines(keepends=True):
+            if not any(field in line for field in fields):
+                lines.append(line)
+            elif line.lstrip().startswith("{"):
+                lines.append(json_sub(line))
+            else:
+                lines.append(logfmt_sub(line))
+        return "".join(lines)
+
+    def _replace_field(self, match):
+        key, quote, value = match.group("key", "quote", "value")
+        formatted = self.format_timestamp(value)
+        if formatted == value:
+            return match[0]
+        if not key.endswith("="):
+            return key + json.dumps(formatted)
+        if quote or " " in formatted:
+            return f'{key}"{formatted}"'
+        return key + formatted
+
+    def convert(self, text):
+        return self.pattern.sub(self._replace, text)
+
+
+def field_patterns(fields):
+    """Return patterns matching a timestamp value of any of fields in JSON
+    and in logfmt."""
+    names = "|".join(re.escape(field) for field in fields)
+    value = r'(?P<quote>"?)(?P<value>[123]\d{9}(?:\d{3}){0,3})(?P=quote)(?![\w.])'
+    return (
+        re.compile(rf'(?P<key>"(?:{names})"\s*:\s*){value}'),
+        re.compile(rf"(?P<key>(?<!\S)(?:{names})=){value}"),
+    )
+
+
+class ReverseConverter:
+    """Replace human readable timestamps in fmt with POSIX timestamps.
+
+    The 'iso' and 'iso-strict' layouts are parsed by a specialized parser,
+    with the epoch of each hour cached. Other formats are found with a
+    pattern generated from fmt and parsed with time.strptime. A fraction of
+    3, 6 or 9 digits gives a timestamp in ms, µs or ns.
+    """
+
+    def __init__(self, fmt, utc, iso, stats=None):
+        self.fmt = fmt
+        self.to_epoch = calendar.timegm if utc else time.mktime
+        self.cache = TimestampCache() if stats is None else stats.cache()
+        if iso:
+            q = '"' if fmt.startswith('"') else ""
+            self.pattern = re.compile(
+                rf"{q}\b(\d{{4}}-\d\d-\d\d[ T]\d\d):(\d\d):(\d\d)"
+                rf"(?:\.(\d{{3}}|\d{{6}}|\d{{9}}))?\b{q}"
+            )
+            self._replace = self._make_replace_iso()
+        else:
+            self.pattern = strftime_pattern(fmt)
+            self._replace = self._replace_strptime
+        if stats is not None:
+            stats.instrument(self)
+
+    def _make_replace_iso(self):
+        cache_get = self.cache.get
+        cache_add = self.cache.add
+        to_epoch = self.to_epoch
+
+        def _replace(match):
+            hour, minutes, seconds, fraction = match.groups()
+            hour_start = cache_get(hour)
+            if hour_start is None:
+                # The whole tuple is needed for mktime() to handle DST.
+                hour_start = int(
+                    to_epoch(
+                        (
+                            int(hour[:4]),
+                            int(hour[5:7]),
+                            int(hour[8:10]),
+                            int(hour[11:]),
+                            0,
+                            0,
+                            0,
+                            0,
+                            -1,
+                        )
+                    )
+                )
+                cache_add(hour, hour_start)
+            epoch = str(hour_start + int(minutes) * 60 + int(seconds))
+            return epoch + fraction if fraction else epoch
+
+        return _replace
+
+    def _replace_strptime(self, match):
+        text = match[0]
+        epoch = self.cache.get(text)
+        if epoch is None:
+            fraction = match.groupdict().get("fraction") or ""
+            try:
+                parsed = time.strptime(
+                    text.replace(fraction, "", 1), self.fmt.replace("%f", "")
+                )
+            except ValueError:
+                return text
+            epoch = str(int(self.to_epoch(parsed)))
+            if len(fraction) in (4, 7, 10):
+                epoch += fraction[1:]
+            self.cache.add(text, epoch)
+        return epoch
+
+    def convert(self, text):
+        return self.pattern.sub(self._replace, text)
+
+
+# Patterns of the strftime directives supported by --reverse.
+STRFTIME_PATTERNS = {
+    "Y": r"\d{4}",
+    "y": r"\d\d",
+    "m": r"\d\d",
+    "d": r"\d\d",
+    "e": r"[ \d]\d",
+    "H": r"\d\d",
+    "I": r"\d\d",
+    "M": r"\d\d",
+    "S": r"\d\d",
+    "j": r"\d{3}",
+    "p": r"\w+",
+    "a": r"\w+",
+    "A": r"\w+",
+    "b": r"\w+",
+    "B": r"\w+",
+    "z": r"[+-]\d{4}",
+    "Z": r"\w+",
+    "f": r"(?P<fraction>\.\d+)?",
+    "%": "%",
+}
+
+
+def strftime_pattern(fmt):
+    """Return a pattern matching the output of strftime(fmt)."""
+    parts = []
+    for literal, directive in re.findall(r"([^%]*)(%.|$)", fmt):
+        parts.append(re.escape(literal))
+        if directive:
+            try:
+                parts.append(STRFTIME_PATTERNS[directive[1]])
+            except KeyError:
+                raise Unix2ISOException(
+                    f"{directive} in --format isn't supported by --reverse"
+                )
+    return re.compile(r"(?<!\d)" + "".join(parts) + r"(?!\d)")
+
+
+def read_blocks(filenames, block_size=BLOCK_SIZE):
+    """Yield the text of filenames (or stdin) in large blocks, each ending at
+    a line boundary."""
+    for filename in filenames or ["-"]:
+        if filename == "-":
+            f = open(sys.stdin.fileno(), closefd=False)
+        else:
+            f = open(filename)
+        with f:
+            rest = ""
+            while block := f.read(block_size):
+                block = rest + block
+                end = block.rfind("\n") + 1
+                rest = block[end:]
+                if end:
+                    yield block[:end]
+            if rest:
+                yield rest
+
+
+def convert_parallel(
+    filenames, converter_class, converter_args, jobs, out, chunk_size=CHUNK_SIZE
+):
+    """Convert filenames in newline aligned chunks over a pool of jobs
+    processes, chunks are written to out in order."""
+    with multiprocessing.Pool(
+        jobs or None,
+        initializer=_init_worker,
+        initargs=(converter_class, converter_args),
+    ) as pool:
+        for text in pool.imap(_convert_chunk, _chunks(filenames, chunk_size)):
+            out.write(text)
+
+
+def _chunks(filenames, chunk_size):
+    """Yield (filename, start, end) of chunks ending at a line boundary."""
+    for filename in filenames:
+        with open(filename, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                start = 0
+                while start < size:
+                    end = m.find(b"\n", min(start + chunk_size, size) - 1) + 1
+                    yield filename, start, end or size
+                    start = end or size
+
+
+def _init_worker(converter_class, converter_args):
+    global _worker_converter
+    locale.setlocale(locale.LC_ALL, "")
+    _worker_converter = converter_class(*converter_args)
+
+
+def _convert_chunk(chunk):
+    filename, start, end = chunk
+    with open(filename, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as m:
+        text = m[start:end].decode(locale.getpreferredencoding(False))
+    if "\r" in text:
+        # Universal newlines, like the files opened in text mode.
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return _worker_converter.convert(text)
+
+
 def main():
     locale.setlocale(locale.LC_ALL, "")
     parser = argparse.ArgumentParser(
@@ -59,7 +498,23 @@ def main():
         "--format",
         default="iso",
         help="Set output format. Possible values are 'iso', 'iso-strict' or a strftime"
-        " format string (respects locale settings). Default: %(default)s.",
+        " format string (respects locale settings), where %%f is the fraction of "
+        "ms/µs/ns timestamps. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "-f",
+        "--field",
+        action="append",
+        dest="fields",
+        metavar="name",
+        help="Only convert the value of field name in JSON or logfmt lines, can be "
+        "repeated. Other lines pass through untouched.",
+    )
+    parser.add_argument(
+        "-r",
+        "--reverse",
+        action="store_true",
+        help="Convert timestamps in --format back to POSIX timestamps instead.",
     )
     parser.add_argument(
         "-u",
@@ -78,7 +533,37 @@ def main():
         action="store_false",
         dest="line_buffering",
     )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Throughput mode for large files, input is read in large blocks "
+        "instead of line by line (implies --no-line-buffering).",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        metavar="N",
+        default=1,
+        help="Convert file arguments in parallel chunks on N processes, 0 for "
+        "all cores (implies --no-line-buffering). stdin is always read "
+        "serially, line by line unless --bulk.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print throughput, cache and timing counters to stderr at exit "
+        "and on SIGUSR1 (ignores --jobs).",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Write cProfile stats of the conversion to FILE at exit, view with "
+        "`python3 -m pstats FILE`.",
+    )
     args, filenames = parser.parse_known_args()
+    if args.reverse and args.fields:
+        parser.error("--field can't be used with --reverse")
 
     log.basicConfig(
         level=args.log_level,
@@ -89,7 +574,14 @@ def main():
     )
     log.debug("args: %s", args)
 
-    sys.stdout.reconfigure(line_buffering=args.line_buffering)
+    if args.stats and args.jobs != 1:
+        log.warning("--stats are only counted in this process, ignoring --jobs")
+        args.jobs = 1
+    # Only files are converted in parallel, stdin keeps streaming line by line.
+    args.parallel = args.jobs != 1 and filenames and "-" not in filenames
+    sys.stdout.reconfigure(
+        line_buffering=args.line_buffering and not (args.bulk or args.parallel)
+    )
 
     now = time.time()
     limit_past = now - args.limit_past * 86400
@@ -109,30 +601,66 @@ def main():
             time.strftime("%Y-%m-%d %H:%M:%S %z (%Z)", time.localtime(now)),
         )
 
-    q = '"' if args.quote else ""
+    # Field values are quoted as their format requires.
+    q = '"' if args.quote and not args.fields else ""
 
     time_func = time.gmtime if args.utc else time.localtime
 
     if args.format == "iso":
-        strftime = functools.partial(time.strftime, f"{q}%Y-%m-%d %H:%M:%S{q}")
+        fmt = f"{q}%Y-%m-%d %H:%M:%S%f{q}"
     elif args.format == "iso-strict":
-        strftime = functools.partial(time.strftime, f"{q}%Y-%m-%dT%H:%M:%S{q}")
+        fmt = f"{q}%Y-%m-%dT%H:%M:%S%f{q}"
     else:
-        strftime = functools.partial(time.strftime, f"{q}{args.format}{q}")
+        fmt = f"{q}{args.format}{q}"
 
-    @functools.lru_cache(maxsize=128)
-    def _format(ts):
-        return strftime(time_func(ts))
+    if args.reverse:
+        converter_class = ReverseConverter
+        converter_args = (fmt, args.utc, args.format in ("iso", "iso-strict"))
+    else:
+        converter_class = Converter
+        converter_args = (
+            limit_past,
+            limit_future,
+            fmt,
+            time_func,
+            TIMESTAMP_RE,
+            args.fields,
+        )
+    stats = None
+    if args.stats:
+        stats = Stats()
+        signal.signal(signal.SIGUSR1, lambda signum, frame: stats.report())
+    converter = converter_class(*converter_args, stats=stats)
+
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        convert(args, filenames, converter, converter_class, converter_args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if stats:
+            stats.report()
+
+
+def convert(args, filenames, converter, converter_class, converter_args):
+    if args.parallel:
+        convert_parallel(
+            filenames, converter_class, converter_args, args.jobs, sys.stdout
+        )
+        return
 
-    def _replace_timestamp(match):
-        timestamp = int(match[0])
-        if limit_past <= timestamp <= limit_future:
-            return _format(timestamp)
-        return match[0]
+    if args.bulk:
+        for block in read_blocks(filenames):
+            sys.stdout.write(converter.convert(block))
+        return
 
     with fileinput.input(files=filenames) as file_:
         for line in file_:
-            print(re.sub(r"\b[123]\d{9}\b", _replace_timestamp, line), end="")
+            print(converter.convert(line), end="")
 
 
 if __name__ == "__main__":
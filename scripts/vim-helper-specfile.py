@@ -3,27 +3,183 @@
 Print stuff for vim macros.
 
 Usage in vim:
-    * configure: `:cabbrev spec r !vim-helper-specfile.py`
+    * configure: `:cabbrev spec r !vim-helper-specfile.py`
     * use: `:spec`
+    * several changelog headers at once: `:r !vim-helper-specfile.py -f spec -f deb`
+
+The git user is cached in $XDG_CACHE_HOME/vim-helper until one of the git config
+files that could set it changes.
 """
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import re
 import subprocess
+import sys
+import tempfile
 import time
 
+FORMATS = {
+    "spec": "* {date:%a %b %e %Y} {name} <{email}> - VER-REL",
+    "deb": " -- {name} <{email}>  {date:%a, %d %b %Y %H:%M:%S %z}",
+    "gnu": "{date:%Y-%m-%d}  {name}  <{email}>",
+}
+INCLUDE_PATH_RE = re.compile(r"\s*path\s*=\s*(.*?)\s*$")
+MAX_CACHE_ENTRIES = 32
+# Config files modified this recently may change again within the same mtime.
+CACHE_MIN_AGE_NS = 2 * 10**9
+
 
 def main():
-    print("* {} {} <{}> - VER-REL".format(time.strftime("%a %b %e %Y"), *_get_git_user()))
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        action="append",
+        choices=FORMATS,
+        help="Changelog header format, repeat for several (default: spec)",
+    )
+    parser.add_argument(
+        "-a", "--all", action="store_true", help="Print headers in all formats"
+    )
+    args = parser.parse_args()
+    formats = list(FORMATS) if args.all else args.format or ["spec"]
+    name, email = _get_git_user()
+    date = datetime.datetime.now().astimezone()
+    for fmt in formats:
+        print(FORMATS[fmt].format(date=date, name=name, email=email))
 
 
 def _get_git_user():
-    proc = subprocess.run(
-        ["git", "config", "user.name"], check=True, capture_output=True, text=True
+    """Return user.name and user.email, from the cache if none of the config
+    files changed."""
+    now = time.time_ns()
+    files = {path: _mtime_ns(path) for path in _config_files()}
+    key = json.dumps(
+        [
+            sorted(files.items()),
+            sorted(item for item in os.environ.items() if item[0].startswith("GIT_")),
+        ]
     )
-    git_user = proc.stdout.strip()
+    cache_home = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    cache_file = pathlib.Path(cache_home, "vim-helper", "git-user.json")
+    try:
+        with cache_file.open() as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if key in cache:
+        return tuple(cache[key])
+
     proc = subprocess.run(
-        ["git", "config", "user.email"], check=True, capture_output=True, text=True
+        ["git", "config", "--get-regexp", r"^user\.(name|email)$"],
+        check=True,
+        capture_output=True,
+        text=True,
     )
-    git_email = proc.stdout.strip()
-    return git_user, git_email
+    values = {}
+    for line in proc.stdout.splitlines():
+        # The last value is the one that applies, like git config user.name.
+        name, _, value = line.partition(" ")
+        values[name] = value
+    if "user.name" not in values or "user.email" not in values:
+        sys.exit("git config user.name and user.email must be set")
+    user = values["user.name"], values["user.email"]
+
+    if all(mtime is None or now - mtime > CACHE_MIN_AGE_NS for mtime in files.values()):
+        cache[key] = user
+        for old_key in list(cache)[:-MAX_CACHE_ENTRIES]:
+            del cache[old_key]
+        _write_cache(cache_file, cache)
+    return user
+
+
+def _write_cache(cache_file, cache):
+    """Replace cache_file atomically, the cache is skipped if it can't be
+    written."""
+    f = None
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cache_file.parent, prefix=cache_file.name, delete=False
+        ) as f:
+            json.dump(cache, f)
+        os.replace(f.name, cache_file)
+    except OSError:
+        if f is not None:
+            pathlib.Path(f.name).unlink(missing_ok=True)
+
+
+def _config_files():
+    """Return the config files git reads and the files they include,
+    conditionally or not, found without running git."""
+    home = pathlib.Path.home()
+    files = [os.environ.get("GIT_CONFIG_SYSTEM", "/etc/gitconfig")]
+    if "GIT_CONFIG_GLOBAL" in os.environ:
+        files.append(os.environ["GIT_CONFIG_GLOBAL"])
+    else:
+        xdg_config = os.environ.get("XDG_CONFIG_HOME") or home / ".config"
+        files += [os.path.join(xdg_config, "git", "config"), str(home / ".gitconfig")]
+    git_dir = _find_git_dir()
+    if git_dir:
+        files.append(str(git_dir / "config"))
+    for path in files:
+        # Appended to while iterating, to follow includes of includes.
+        for include in _includes(path):
+            if include not in files and len(files) < 100:
+                files.append(include)
+    return files
+
+
+def _find_git_dir():
+    """Return the common git dir of the repository at the current directory,
+    where its config is."""
+    if "GIT_DIR" in os.environ:
+        return pathlib.Path(os.environ["GIT_DIR"])
+    cwd = pathlib.Path.cwd()
+    for directory in (cwd, *cwd.parents):
+        dot_git = directory / ".git"
+        if dot_git.is_dir():
+            return dot_git
+        if dot_git.is_file():
+            # A worktree or submodule: "gitdir: <path>".
+            git_dir = directory / dot_git.read_text().partition(":")[2].strip()
+            common_dir = git_dir / "commondir"
+            if common_dir.is_file():
+                return git_dir / common_dir.read_text().strip()
+            return git_dir
+    return None
+
+
+def _includes(path):
+    """Return the paths of the [include] and [includeIf] sections of path."""
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    includes = []
+    section = ""
+    for line in lines:
+        if line.lstrip().startswith("["):
+            section = line.strip().lower()
+        elif section.startswith(("[include]", "[includeif")):
+            match = INCLUDE_PATH_RE.match(line)
+            if match:
+                include = os.path.expanduser(match[1].strip('"'))
+                includes.append(os.path.join(os.path.dirname(path), include))
+    return includes
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+"""
+Tests of scripts/_tmux_control.py against the fake control mode server
+(benchmarks/fake_tmux.py), and the quoting against tmux itself if it's
+installed.
+
+Usage: python3 -m unittest discover tests
+"""
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+from _tmux_control import ControlClient, TmuxError, command_line  # noqa: E402
+
+FAKE_TMUX = (sys.executable, str(ROOT / "benchmarks" / "fake_tmux.py"))
+PANES = [{"id": "%0", "pid": 1, "window": "@0"}, {"id": "%1", "pid": 2, "window": "@1"}]
+
+# Arguments the tmux command parser would change if they weren't quoted.
+AWKWARD_ARGS = [
+    "",
+    "two words",
+    "~",
+    "~/dir",
+    "~root",
+    "a~b",
+    "'single'",
+    '"double"',
+    "back\\slash",
+    "trailing\\",
+    "$HOME",
+    "${HOME}",
+    "semi;colon",
+    "{ brace }",
+    "tab\there",
+    "new\nline",
+    "-flag",
+    "é ü",
+]
+
+
+class FakeServerTest(unittest.TestCase):
+    def connect(self, cmd_timeout=5, **config):
+        """Start a ControlClient on a fake server with config."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        config_file = pathlib.Path(tmp.name) / "config.json"
+        config_file.write_text(json.dumps(dict({"panes": PANES}, **config)))
+        env = {"FAKE_TMUX_CONFIG": str(config_file), "HOME": "/home/fake"}
+        with mock.patch.dict(os.environ, env):
+            tmux = ControlClient(
+                cmd_timeout=cmd_timeout, argv=FAKE_TMUX + ("-C", "attach-session")
+            )
+        self.addCleanup(tmux.close)
+        return tmux
+
+    def test_command(self):
+        tmux = self.connect()
+        self.assertEqual(
+            tmux.command("list-panes", "-a", "-F", "#{pane_id} #{window_id}"),
+            ["%0 @0", "%1 @1"],
+        )
+        self.assertEqual(tmux.command("select-pane", "-t", "%1"), [])
+
+    def test_error(self):
+        tmux = self.connect()
+        with self.assertRaisesRegex(TmuxError, "can't find pane: %9"):
+            tmux.command("select-pane", "-t", "%9")
+        # The connection is still usable after an error.
+        self.assertEqual(tmux.command("display-message", "-p", "x"), ["x"])
+
+    def test_pipeline(self):
+        tmux = self.connect()
+        replies = tmux.pipeline(
+            [
+                ("display-message", "-p", "-t", "%1", "#{pane_pid}"),
+                ("no-such-command",),
+                ("list-windows", "-a", "-F", "#{window_id}"),
+            ]
+        )
+        self.assertEqual(
+            [tuple(reply) for reply in replies],
+            [
+                (["2"], False),
+                (["unknown command: no-such-command"], True),
+                (["@0", "@1"], False),
+            ],
+        )
+        self.assertEqual(tmux.pipeline([]), [])
+
+    def test_notifications(self):
+        tmux = self.connect(notifications=["%window-add @2", "%sessions-changed"])
+        tmux.notifications.clear()
+        self.assertEqual(tmux.command("display-message", "-p", "x"), ["x"])
+        self.assertEqual(
+            list(tmux.notifications), ["%window-add @2", "%sessions-changed"]
+        )
+        self.assertEqual(tmux.read_notification(0), "%window-add @2")
+        self.assertEqual(tmux.read_notification(0), "%sessions-changed")
+        self.assertIsNone(tmux.read_notification(0))
+        # Notifications written while no command runs are read from the pipe.
+        tmux._proc.stdin.write(b'display-message "x"\n')
+        tmux._proc.stdin.flush()
+        self.assertEqual(tmux.read_notification(5), "%window-add @2")
+        self.assertEqual(tmux.read_notification(5), "%sessions-changed")
+        with self.assertRaisesRegex(TmuxError, "unexpected reply"):
+            tmux.read_notification(5)
+
+    def test_timeout(self):
+        tmux = self.connect(delays={"capture-pane": 2})
+        tmux.cmd_timeout = 0.2
+        start = time.monotonic()
+        with self.assertRaisesRegex(TmuxError, "timeout"):
+            tmux.command("capture-pane", "-p", "-t", "%0")
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_timeout_connect(self):
+        with self.assertRaisesRegex(TmuxError, "timeout"):
+            ControlClient(cmd_timeout=0.2, argv=("sleep", "5"))
+
+    def test_closed(self):
+        with self.assertRaisesRegex(TmuxError, "connection closed"):
+            ControlClient(argv=("true",))
+
+    def test_quote(self):
+        tmux = self.connect()
+        replies = tmux.pipeline(
+            ("display-message", "-p", "--", arg) for arg in AWKWARD_ARGS
+        )
+        self.assertEqual(
+            [reply.output for reply in replies],
+            [arg.split("\n") for arg in AWKWARD_ARGS],
+        )
+
+
+@unittest.skipIf(not shutil.which("tmux"), "tmux is not installed")
+class TmuxQuoteTest(unittest.TestCase):
+    def setUp(self):
+        self.socket = "test-tmux-control-%d" % os.getpid()
+        subprocess.run(
+            ["tmux", "-L", self.socket, "-f", "/dev/null", "new-session", "-d"],
+            check=True,
+            env=dict(os.environ, TMUX=""),
+        )
+        self.addCleanup(
+            subprocess.run, ["tmux", "-L", self.socket, "kill-server"], check=False
+        )
+
+    def test_quote(self):
+        # display-message expands formats (#{...}, %%), the arguments don't
+        # contain any.
+        argv = ("tmux", "-L", self.socket, "-C", "attach-session", "-E")
+        with ControlClient(cmd_timeout=5, argv=argv) as tmux:
+            for arg in AWKWARD_ARGS:
+                with self.subTest(command_line([arg])):
+                    self.assertEqual(
+                        tmux.command("display-message", "-p", "--", arg),
+                        arg.split("\n"),
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()